@@ -0,0 +1,83 @@
+import asyncio
+import random
+import time
+from aiohttp import web
+
+
+class FakeTelegramServer:
+    # Stand-in for the Bot API: answers every method successfully (after `latency` seconds) and
+    # answers a `retry_after_rate` share of the sendMessage calls with 429 "retry after".
+    # Records when every message arrived, per chat.
+
+    def __init__(self, latency: float = 0.0, retry_after_rate: float = 0.0, retry_after: int = 1):
+        self.latency = latency
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.calls: dict[str, int] = {}
+        self.sent_at: list[tuple[int, float]] = []
+        self._message_id = 0
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] = self.calls.get(method, 0) + 1
+        data = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == 'sendMessage' and random.random() < self.retry_after_rate:
+            return web.json_response({'ok': False,
+                                      'error_code': 429,
+                                      'description': f'Too Many Requests: retry after {self.retry_after}',
+                                      'parameters': {'retry_after': self.retry_after}}, status=429)
+
+        if method in ('sendMessage', 'editMessageText', 'editMessageReplyMarkup'):
+            chat_id = int(data.get('chat_id', 0))
+            if method == 'sendMessage':
+                self.sent_at.append((chat_id, time.monotonic()))
+            self._message_id += 1
+            return web.json_response({'ok': True, 'result': {'message_id': self._message_id,
+                                                             'date': int(time.time()),
+                                                             'chat': {'id': chat_id, 'type': 'private'},
+                                                             'text': data.get('text', '')}})
+        return web.json_response({'ok': True, 'result': True})
+
+
+class FakeCryptoCompareServer:
+    # Stand-in for the pricemulti endpoint, every symbol gets a price that moves a little per call.
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self._prices: dict[str, float] = {}
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/data/pricemulti', self.pricemulti)
+        return app
+
+    async def pricemulti(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        prices = {}
+        for symbol in request.query.get('fsyms', '').split(','):
+            if symbol:
+                price = self._prices.get(symbol, random.uniform(1, 50000)) * random.uniform(0.99, 1.01)
+                self._prices[symbol] = price
+                prices[symbol] = {'USD': round(price, 2)}
+        return web.json_response(prices)
+
+
+async def start_server(app: web.Application, host: str = '127.0.0.1', port: int = 0) -> tuple[web.AppRunner, str]:
+    # Port 0 picks a free port, returns the runner and the server's base URL.
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://{host}:{port}'
@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+from sqlalchemy import event
+from bench.fake_servers import FakeTelegramServer, FakeCryptoCompareServer, start_server
+from bench.seed import seed_database
+
+BUTTONS = ['دریافت قیمت لحظه ای 📈', 'پروفایل 🧒', 'هشدار قیمت 🔔']
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine.sync_engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+    def reset(self) -> int:
+        count, self.count = self.count, 0
+        return count
+
+
+def percentile(values: list[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def format_latencies(values: list[float]) -> str:
+    return f'p50={percentile(values, 50) * 1000:.1f}ms p99={percentile(values, 99) * 1000:.1f}ms'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Offline load test against fake Telegram and CryptoCompare servers.')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--cryptos', type=int, default=50)
+    parser.add_argument('--cryptos-per-user', type=int, default=3)
+    parser.add_argument('--history-hours', type=int, default=24)
+    parser.add_argument('--alerts', type=int, default=1000)
+    parser.add_argument('--ticks', type=int, default=1, help='Full update ticks to run')
+    parser.add_argument('--presses', type=int, default=2000, help='Button presses to feed to the dispatcher')
+    parser.add_argument('--press-concurrency', type=int, default=50)
+    parser.add_argument('--rate', type=float, default=1000,
+                        help='Messages per second allowed by the delivery engine (Telegram allows 30)')
+    parser.add_argument('--delivery-concurrency', type=int, default=50)
+    parser.add_argument('--telegram-latency', type=float, default=0.005)
+    parser.add_argument('--retry-after-rate', type=float, default=0.0)
+    parser.add_argument('--api-latency', type=float, default=0.05)
+    parser.add_argument('--database-url', default=None,
+                        help='Defaults to a new SQLite file. Use an empty database, the benchmark seeds it.')
+    parser.add_argument('--verbose', action='store_true', help="Show the bot's own output")
+    return parser.parse_args()
+
+
+async def run(args):
+    telegram = FakeTelegramServer(latency=args.telegram_latency, retry_after_rate=args.retry_after_rate)
+    cryptocompare = FakeCryptoCompareServer(latency=args.api_latency)
+    telegram_runner, telegram_url = await start_server(telegram.create_app())
+    cryptocompare_runner, cryptocompare_url = await start_server(cryptocompare.create_app())
+    os.environ['TELEGRAM_API_URL'] = telegram_url
+    os.environ.setdefault('BOT_TOKEN', '123456:bench')
+
+    # crypto_track reads its settings at import time, so it is imported once the fake servers run.
+    from aiogram import Dispatcher
+    from aiogram.types import Update
+    from sqlalchemy import update
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from crypto_track.api.manager import AsyncAPIManager
+    from crypto_track.bot import bot
+    from crypto_track.coordination import NodeCoordinator
+    from crypto_track.crypto_price import crypto_price_router
+    from crypto_track.database.manager import AsyncDatabaseManager
+    from crypto_track.database.models import User
+    from crypto_track.database.run import init_db
+    from crypto_track.delivery import DeliveryEngine
+    from crypto_track.outbox import OutboxWorker
+    from crypto_track.price_alert import price_alert_router
+    from crypto_track.profile import profile_router
+    from crypto_track.signup import signup_router
+    from crypto_track.update_price import update_prices_manager
+
+    database_url = args.database_url or f'sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db'
+    engine = await init_db(database_url=database_url, echo=False)
+    AsyncDatabaseManager(async_session=async_sessionmaker(engine, expire_on_commit=False))
+    api = AsyncAPIManager(api_key='bench', base_url=cryptocompare_url)
+    await api.start()
+    NodeCoordinator()
+    queries = QueryCounter(engine)
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+
+    try:
+        started_at = time.monotonic()
+        await seed_database(engine, users=args.users, cryptos=args.cryptos, cryptos_per_user=args.cryptos_per_user,
+                            history_hours=args.history_hours, alerts=args.alerts)
+        print(f'Seeded {args.users} users, {args.cryptos} cryptos in {time.monotonic() - started_at:.1f}s ({database_url})')
+        queries.reset()
+
+        worker = OutboxWorker(DeliveryEngine(bot,
+                                             concurrency=args.delivery_concurrency,
+                                             global_rate=args.rate,
+                                             chat_rate=args.rate))
+        for tick in range(args.ticks):
+            telegram.sent_at.clear()
+            if tick:
+                # Makes every user due again.
+                async with engine.begin() as conn:
+                    await conn.execute(update(User).values(next_due_at=User.last_update))
+                queries.reset()
+
+            with quiet:
+                tick_started_at = time.monotonic()
+                await update_prices_manager()
+                enqueue_elapsed = time.monotonic() - tick_started_at
+                enqueue_queries = queries.reset()
+
+                drain_started_at = time.monotonic()
+                while await worker.drain_batch():
+                    pass
+                drain_elapsed = time.monotonic() - drain_started_at
+                drain_queries = queries.reset()
+
+            sent = len(telegram.sent_at)
+            latencies = [sent_at - tick_started_at for _, sent_at in telegram.sent_at]
+            print(f'tick {tick + 1}: enqueue {enqueue_elapsed:.2f}s ({enqueue_queries} queries), '
+                  f'delivery {drain_elapsed:.2f}s ({drain_queries} queries), '
+                  f'{sent} messages, {sent / drain_elapsed if drain_elapsed else 0:.0f} msg/s, '
+                  f'tick-to-send {format_latencies(latencies)}')
+
+        dp = Dispatcher()
+        dp.include_routers(signup_router, profile_router, crypto_price_router, price_alert_router)
+        semaphore = asyncio.Semaphore(args.press_concurrency)
+        press_latencies = []
+
+        async def press(update_id: int):
+            user_id = random.randint(1, args.users)
+            telegram_update = Update.model_validate({
+                'update_id': update_id,
+                'message': {'message_id': update_id, 'date': int(time.time()),
+                            'chat': {'id': user_id, 'type': 'private'},
+                            'from': {'id': user_id, 'is_bot': False, 'first_name': 'bench'},
+                            'text': random.choice(BUTTONS)}
+            }, context={'bot': bot})
+            async with semaphore:
+                pressed_at = time.monotonic()
+                await dp.feed_update(bot, telegram_update)
+                press_latencies.append(time.monotonic() - pressed_at)
+
+        with quiet:
+            presses_started_at = time.monotonic()
+            await asyncio.gather(*[press(update_id) for update_id in range(1, args.presses + 1)])
+            presses_elapsed = time.monotonic() - presses_started_at
+        press_queries = queries.reset()
+        print(f'buttons: {args.presses} presses in {presses_elapsed:.2f}s '
+              f'({args.presses / presses_elapsed if presses_elapsed else 0:.0f}/s), {format_latencies(press_latencies)}, '
+              f'{press_queries / max(args.presses, 1):.1f} queries per press')
+        print(f'telegram calls: {telegram.calls}, pricemulti requests: {cryptocompare.requests}')
+    finally:
+        await api.close()
+        await bot.session.close()
+        await engine.dispose()
+        await telegram_runner.cleanup()
+        await cryptocompare_runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(run(parse_args()))
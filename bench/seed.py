@@ -0,0 +1,62 @@
+import random
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+from crypto_track.database.models import User, Crypto, Price, PriceAlert, user_crypto_association
+from crypto_track.enums import TimeOptions, AlertDirection
+
+SEED_CHUNK_SIZE = 10000
+
+
+async def insert_chunked(conn, table, rows: list):
+    for start in range(0, len(rows), SEED_CHUNK_SIZE):
+        await conn.execute(insert(table), rows[start:start + SEED_CHUNK_SIZE])
+
+
+async def seed_database(engine: AsyncEngine,
+                        users: int,
+                        cryptos: int,
+                        cryptos_per_user: int = 3,
+                        history_hours: int = 24,
+                        alerts: int = 0,
+                        seed: int = 0):
+    # Synthetic data: every user is due now and tracks a few random cryptos, every crypto has a
+    # price every 10 minutes for the last history_hours.
+    randomizer = random.Random(seed)
+    now = datetime.now(timezone.utc)
+
+    crypto_rows = []
+    price_rows = []
+    for crypto_id in range(1, cryptos + 1):
+        price = randomizer.uniform(1, 50000)
+        for step in range(history_hours * 6, 0, -1):
+            price *= randomizer.uniform(0.99, 1.01)
+            price_rows.append({'crypto_id': crypto_id, 'price': round(price, 2), 'date': now - timedelta(minutes=10 * step)})
+        crypto_rows.append({'id': crypto_id, 'name': f'Coin {crypto_id}', 'symbol': f'C{crypto_id:04d}',
+                            'last_price': round(price, 2), 'last_price_at': now})
+
+    user_rows = []
+    tracking_rows = []
+    for user_id in range(1, users + 1):
+        user_rows.append({'id': user_id, 'name': f'user {user_id}', 'how_often': TimeOptions.TEN,
+                          'joined_date': now, 'last_update': now - timedelta(minutes=10),
+                          'next_due_at': now - timedelta(minutes=1)})
+        for crypto_id in randomizer.sample(range(1, cryptos + 1), min(cryptos_per_user, cryptos)):
+            tracking_rows.append({'user_id': user_id, 'crypto_id': crypto_id})
+
+    alert_rows = []
+    for _ in range(alerts):
+        crypto = randomizer.choice(crypto_rows)
+        direction = randomizer.choice(list(AlertDirection))
+        # Within a couple percent of the price, so some of them trigger during the benchmark.
+        change = randomizer.uniform(0.98, 1.02)
+        alert_rows.append({'user_id': randomizer.randint(1, users), 'crypto_id': crypto['id'],
+                           'direction': direction, 'threshold': round(crypto['last_price'] * change, 2),
+                           'created_at': now})
+
+    async with engine.begin() as conn:
+        await insert_chunked(conn, Crypto.__table__, crypto_rows)
+        await insert_chunked(conn, Price.__table__, price_rows)
+        await insert_chunked(conn, User.__table__, user_rows)
+        await insert_chunked(conn, user_crypto_association, tracking_rows)
+        await insert_chunked(conn, PriceAlert.__table__, alert_rows)
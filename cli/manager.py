@@ -3,7 +3,10 @@ import os
 from rich.console import Console
 from crypto_track.database.manager import AsyncDatabaseManager
 from cli.utils import validate_price
+from cli.transfer import (EXPORT_DATASETS, IMPORT_DATASETS, EXPORT_FORMATS, export_dataset,
+                          import_cryptos, import_prices)
 from crypto_track.update_price import update_all_cryptos
+from crypto_track.catalog import crypto_catalog
 
 class CLIManager:
     ri = Console()
@@ -26,7 +29,9 @@ Developer: wwwaramii
 5- Delete a user
 6- Delete all prices of a crypto
 7- Update all cryptos
-8- Quit"""
+8- Export data
+9- Import data
+10- Quit"""
 
     async def start(self):
         # Start the program
@@ -65,6 +70,10 @@ Developer: wwwaramii
             case '7':
                 await self.update_cryptos()
             case '8':
+                await self.export_data()
+            case '9':
+                await self.import_data()
+            case '10':
                 sys.exit()
             case _:
                 self.ri.print('Not a valid command! Enter the command number please.', style='green bold')
@@ -104,6 +113,7 @@ Developer: wwwaramii
             crypto = await AsyncDatabaseManager().create_new_crypto(crypto_name=name.strip(),
                                                            symbol=symbol.strip(),
                                                            current_price=price)
+            crypto_catalog.invalidate()
             self.ri.print(f'New crypto created: {crypto}.')
         except Exception as ex:
             self.ri.print(f'Something went wrong while trying to create the crypto! Detail: {ex}', style='red bold')
@@ -116,6 +126,7 @@ Developer: wwwaramii
             crypto_id = input()
             result = await AsyncDatabaseManager().delete_crypto(crypto_id=crypto_id)
             if result:
+                crypto_catalog.invalidate()
                 self.ri.print(f'Crypto with (id={crypto_id}), deleted.', style='green bold')
             else:
                 self.ri.print(f'Could not delete Crypto with (id={crypto_id})!.', style='red bold')
@@ -124,9 +135,9 @@ Developer: wwwaramii
         self.ri.print('*List of all cryptos:(Use "ctrl + c" to cancel). ', style='bold')
         self.ri.print('Press Enter: ', style='bold blue', end='')
         input()
-        cryptos_prices = await AsyncDatabaseManager().get_multiple_cryptos_current_price()
-        for index, price in enumerate(cryptos_prices):
-            self.ri.print(f'{index+1}- {price.crypto}, Price: {price.price}$')
+        cryptos = await AsyncDatabaseManager().get_multiple_cryptos_current_price()
+        for index, crypto in enumerate(cryptos):
+            self.ri.print(f'{index+1}- {crypto}, Price: {crypto.last_price}$')
 
         self.ri.print('Press Enter to continue: ', end='')
         input()
@@ -176,3 +187,50 @@ Developer: wwwaramii
                 self.ri.print(f'All prices of crypto with (id={crypto_id}), deleted.', style='green bold')
             else:
                 self.ri.print(f'Could not delete all prices of crypto (id={crypto_id}).', style='red bold')
+
+    def ask_choice(self, prompt: str, choices: tuple, default: str = None) -> str:
+        while True:
+            self.ri.print(f'{prompt} ({"/".join(choices)}): ', end='', style='bold')
+            choice = input().strip().lower() or default
+            if choice in choices:
+                return choice
+            self.ri.print('Please enter one of the options.', style='red')
+
+    async def export_data(self):
+        self.ri.print('*Export data to a file(Use "ctrl + c" to cancel.): ', style='bold')
+        dataset = self.ask_choice('What to export', EXPORT_DATASETS)
+        export_format = self.ask_choice('File format', EXPORT_FORMATS, default='csv')
+        default_path = f'{dataset}.{export_format}'
+        self.ri.print(f'Enter the file path [{default_path}]: ', end='', style='bold')
+        path = input().strip() or default_path
+
+        try:
+            exported = await export_dataset(dataset, export_format, path)
+            self.ri.print(f'{exported} {dataset} exported to {path}.', style='green bold')
+        except Exception as ex:
+            self.ri.print(f'Something went wrong while exporting {dataset}! Detail: {ex}', style='red bold')
+
+    async def import_data(self):
+        self.ri.print('*Import data from a CSV file(Use "ctrl + c" to cancel.): ', style='bold')
+        self.ri.print('Cryptos need name and symbol columns, prices need symbol, date and price columns '
+                      '(as exported).', style='white')
+        self.ri.print('Prices already stored for a crypto and date are skipped. Prices older than the running '
+                      'candles backfill are stored, their candles are built by the backfill.', style='white')
+        dataset = self.ask_choice('What to import', IMPORT_DATASETS)
+        while True:
+            self.ri.print('Enter the CSV file path: ', end='', style='bold')
+            path = input().strip()
+            if os.path.isfile(path):
+                break
+            self.ri.print('File not found.', style='red')
+
+        try:
+            if dataset == 'cryptos':
+                imported = await import_cryptos(path)
+                self.ri.print(f'{imported} new cryptos imported.', style='green bold')
+            else:
+                imported, stored, skipped = await import_prices(path)
+                self.ri.print(f'{imported} prices imported, {stored} already stored and {skipped} rows of unknown '
+                              'cryptos skipped.', style='green bold')
+        except Exception as ex:
+            self.ri.print(f'Something went wrong while importing {dataset}! Detail: {ex}', style='red bold')
@@ -0,0 +1,183 @@
+import csv
+from datetime import datetime
+from typing import AsyncIterator, Iterator, Optional
+from crypto_track.catalog import crypto_catalog
+from crypto_track.database.manager import AsyncDatabaseManager, as_utc, calculate_bucket_start
+from crypto_track.enums import Resolution
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    # Parquet export is optional, CSV works without it.
+    pyarrow = None
+
+# Rows read from the database or the CSV file and written per batch, so memory use doesn't grow
+# with the size of the data.
+BATCH_SIZE = 5000
+
+EXPORT_DATASETS = ('users', 'cryptos', 'prices')
+IMPORT_DATASETS = ('cryptos', 'prices')
+EXPORT_FORMATS = ('csv', 'parquet')
+
+EXPORT_COLUMNS = {
+    'users': ['id', 'name', 'how_often', 'joined_date', 'last_update', 'next_due_at', 'tracking_cryptos'],
+    'cryptos': ['id', 'name', 'symbol', 'last_price', 'last_price_at'],
+    'prices': ['symbol', 'date', 'price'],
+}
+TIMESTAMP_COLUMNS = {'joined_date', 'last_update', 'next_due_at', 'last_price_at', 'date'}
+FLOAT_COLUMNS = {'last_price', 'price'}
+INTEGER_COLUMNS = {'id'}
+
+
+class CSVExportWriter:
+    def __init__(self, path: str, columns: list[str]):
+        self.file = open(path, 'w', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write_rows(self, rows: list[tuple]):
+        self.writer.writerows([format_csv_value(value) for value in row] for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetExportWriter:
+    # Every batch becomes one row group.
+    def __init__(self, path: str, columns: list[str]):
+        self.columns = columns
+        self.schema = pyarrow.schema([(column, parquet_type(column)) for column in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write_rows(self, rows: list[tuple]):
+        values = list(zip(*rows))
+        arrays = {column: [format_parquet_value(column, value) for value in column_values]
+                  for column, column_values in zip(self.columns, values)}
+        self.writer.write_table(pyarrow.Table.from_pydict(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def parquet_type(column: str):
+    if column in TIMESTAMP_COLUMNS:
+        return pyarrow.timestamp('us', tz='UTC')
+    if column in FLOAT_COLUMNS:
+        return pyarrow.float64()
+    if column in INTEGER_COLUMNS:
+        return pyarrow.int64()
+    return pyarrow.string()
+
+
+def format_csv_value(value):
+    if isinstance(value, datetime):
+        return as_utc(value).isoformat()
+    return '' if value is None else value
+
+
+def format_parquet_value(column: str, value):
+    if value is None:
+        return None
+    if column in TIMESTAMP_COLUMNS:
+        return as_utc(value)
+    if column in FLOAT_COLUMNS:
+        return float(value)
+    return value
+
+
+async def stream_export_rows(dataset: str) -> AsyncIterator[list[tuple]]:
+    if dataset == 'users':
+        async for users in AsyncDatabaseManager().stream_users(chunk_size=BATCH_SIZE):
+            yield [(user.id, user.name, user.how_often.value if user.how_often else None, user.joined_date,
+                    user.last_update, user.next_due_at, ' '.join(crypto.symbol for crypto in user.tracking_cryptos))
+                   for user in users]
+    elif dataset == 'cryptos':
+        async for cryptos in AsyncDatabaseManager().stream_cryptos(chunk_size=BATCH_SIZE):
+            yield [(crypto.id, crypto.name, crypto.symbol, crypto.last_price, crypto.last_price_at) for crypto in cryptos]
+    else:
+        async for rows in AsyncDatabaseManager().stream_prices(chunk_size=BATCH_SIZE):
+            yield [tuple(row) for row in rows]
+
+
+async def export_dataset(dataset: str, export_format: str, path: str) -> int:
+    if export_format == 'parquet' and pyarrow is None:
+        raise RuntimeError('Parquet export needs pyarrow, install it with "pip install pyarrow".')
+    writer_class = ParquetExportWriter if export_format == 'parquet' else CSVExportWriter
+    writer = writer_class(path, EXPORT_COLUMNS[dataset])
+    exported = 0
+    try:
+        async for rows in stream_export_rows(dataset):
+            writer.write_rows(rows)
+            exported += len(rows)
+    finally:
+        writer.close()
+    return exported
+
+
+def read_csv_batches(path: str, required_columns: list[str]) -> Iterator[list[dict]]:
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        reader = csv.DictReader(file)
+        missing_columns = set(required_columns) - set(reader.fieldnames or [])
+        if missing_columns:
+            raise ValueError(f'The CSV file has no {", ".join(sorted(missing_columns))} column.')
+        batch = []
+        for row in reader:
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def parse_date(value: str) -> datetime:
+    return as_utc(datetime.fromisoformat(value))
+
+
+def parse_optional_float(value: Optional[str]) -> Optional[float]:
+    return float(value) if value else None
+
+
+async def import_cryptos(path: str) -> int:
+    # Cryptos whose symbol is already stored are skipped.
+    imported = 0
+    for batch in read_csv_batches(path, ['name', 'symbol']):
+        rows = [{'name': row['name'].strip(),
+                 'symbol': row['symbol'].strip().upper(),
+                 'last_price': parse_optional_float(row.get('last_price')),
+                 'last_price_at': parse_date(row['last_price_at']) if row.get('last_price_at') else None}
+                for row in batch]
+        imported += await AsyncDatabaseManager().import_cryptos(rows)
+    crypto_catalog.invalidate()
+    return imported
+
+
+async def import_prices(path: str) -> tuple[int, int, int]:
+    # Returns the imported prices, the rows skipped because their price is already stored and the
+    # rows skipped because their symbol is unknown.
+    # Rows are buffered up to the next day boundary of the crypto after BATCH_SIZE rows, so a
+    # candle is never split between two batches when the file is ordered by symbol and date
+    # (as exported).
+    crypto_ids = {crypto.symbol: crypto.id for crypto in await crypto_catalog.get_cryptos()}
+    imported = stored = skipped = 0
+    pending = []
+    for batch in read_csv_batches(path, ['symbol', 'date', 'price']):
+        for row in batch:
+            crypto_id = crypto_ids.get(row['symbol'].strip().upper())
+            if crypto_id is None:
+                skipped += 1
+                continue
+            price = {'crypto_id': crypto_id, 'date': parse_date(row['date']), 'price': float(row['price'])}
+            if len(pending) >= BATCH_SIZE and not same_day(pending[-1], price):
+                inserted = await AsyncDatabaseManager().import_prices(pending)
+                imported, stored = imported + inserted, stored + len(pending) - inserted
+                pending = []
+            pending.append(price)
+    inserted = await AsyncDatabaseManager().import_prices(pending)
+    return imported + inserted, stored + len(pending) - inserted, skipped
+
+
+def same_day(first: dict, second: dict) -> bool:
+    return first['crypto_id'] == second['crypto_id'] and \
+        calculate_bucket_start(first['date'], Resolution.DAY) == calculate_bucket_start(second['date'], Resolution.DAY)
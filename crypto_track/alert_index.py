@@ -0,0 +1,118 @@
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+from math import inf
+from typing import List, Optional, Tuple
+from crypto_track.database.manager import AsyncDatabaseManager
+from crypto_track.database.models import PriceAlert, Crypto
+from crypto_track.catalog import crypto_catalog
+from crypto_track.enums import AlertDirection
+
+
+with open('messages/alerts/alert_triggered.txt', 'r', encoding='utf-8') as file:
+    alert_triggered_text = file.read()
+
+ALERT_DIRECTION_TEXT = {
+    AlertDirection.ABOVE: 'بالاتر از',
+    AlertDirection.BELOW: 'پایین تر از',
+}
+
+
+class AlertIndex:
+    # Active price alerts grouped by crypto, in lists sorted by threshold:
+    #   above: fires when price >= threshold, so the crossed alerts are a prefix of the list.
+    #   below: fires when price <= threshold, so the crossed alerts are a suffix of the list.
+    # Finding the crossed alerts of a crypto is a bisect plus a slice, O(log n + k).
+
+    def __init__(self, prune_every: int = 60):
+        self._above: dict[int, List[Tuple[float, int]]] = {}
+        self._below: dict[int, List[Tuple[float, int]]] = {}
+        self._alerts: dict[int, PriceAlert] = {}
+        # Alerts are synced from the database by id, so ones created by any process get picked up.
+        self.last_alert_id: Optional[int] = None
+        # Alerts deleted by their user are dropped every prune_every syncs.
+        self.prune_every = prune_every
+        self._syncs = 0
+
+    def add(self, alert: PriceAlert):
+        if alert.id in self._alerts:
+            return
+        self._alerts[alert.id] = alert
+        triggers = self._above if alert.direction == AlertDirection.ABOVE else self._below
+        insort(triggers.setdefault(alert.crypto_id, []), (alert.threshold, alert.id))
+        if self.last_alert_id is None or alert.id > self.last_alert_id:
+            self.last_alert_id = alert.id
+
+    def remove(self, alert_id: int):
+        alert = self._alerts.pop(alert_id, None)
+        if alert is None:
+            return
+        triggers = (self._above if alert.direction == AlertDirection.ABOVE else self._below).get(alert.crypto_id, [])
+        index = bisect_left(triggers, (alert.threshold, alert.id))
+        if index < len(triggers) and triggers[index][1] == alert.id:
+            del triggers[index]
+
+    def pop_crossed(self, crypto_id: int, price) -> List[PriceAlert]:
+        crossed_ids = []
+
+        above = self._above.get(crypto_id)
+        if above:
+            end = bisect_right(above, (price, inf))
+            crossed_ids.extend(alert_id for _, alert_id in above[:end])
+            del above[:end]
+
+        below = self._below.get(crypto_id)
+        if below:
+            start = bisect_left(below, (price, -inf))
+            crossed_ids.extend(alert_id for _, alert_id in below[start:])
+            del below[start:]
+
+        return [self._alerts.pop(alert_id) for alert_id in crossed_ids]
+
+    async def sync(self):
+        for alert in await AsyncDatabaseManager().get_active_price_alerts(after_id=self.last_alert_id):
+            self.add(alert)
+        self._syncs += 1
+        if self._syncs % self.prune_every == 0:
+            await self.prune()
+
+    async def prune(self):
+        active_ids = set(await AsyncDatabaseManager().get_active_price_alert_ids())
+        for alert_id in [alert_id for alert_id in self._alerts if alert_id not in active_ids]:
+            self.remove(alert_id)
+
+
+alert_index = AlertIndex()
+
+
+async def check_price_alerts(prices: dict[int, float]) -> int:
+    # Called with the prices of a tick, triggers the crossed alerts and queues their notifications.
+    # Returns the number of notifications enqueued.
+    await alert_index.sync()
+
+    crossed_alerts = []
+    for crypto_id, price in prices.items():
+        crossed_alerts.extend(alert_index.pop_crossed(crypto_id, price))
+    if not crossed_alerts:
+        return 0
+
+    try:
+        cryptos = await crypto_catalog.get_cryptos_by_id()
+        return await AsyncDatabaseManager().trigger_price_alerts(
+            messages={alert.id: (alert.user_id,
+                                 generate_alert_text(alert, cryptos.get(alert.crypto_id), prices[alert.crypto_id]),
+                                 f'alert:{alert.id}')
+                      for alert in crossed_alerts},
+            timestamp=datetime.now(timezone.utc)
+        )
+    except Exception:
+        # Nothing was triggered, the alerts are checked again on the next tick.
+        for alert in crossed_alerts:
+            alert_index.add(alert)
+        raise
+
+
+def generate_alert_text(alert: PriceAlert, crypto: Optional[Crypto], price) -> str:
+    return alert_triggered_text.format(crypto_name=crypto.name if crypto else alert.crypto_id,
+                                       direction=ALERT_DIRECTION_TEXT[alert.direction],
+                                       threshold=alert.threshold,
+                                       price=price)
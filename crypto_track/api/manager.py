@@ -1,28 +1,112 @@
+import asyncio
+import time
 import aiohttp
-import json
+from crypto_track.metrics import API_CHUNK_SECONDS
 
 class AsyncAPIManager:
     _instance = None
     _is_initialized = False
 
-    def __new__(cls, api_key=None):
+    BASE_URL = 'https://min-api.cryptocompare.com'
+    # pricemulti accepts at most 300 characters in fsyms.
+    MAX_FSYMS_LENGTH = 300
+
+    def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super(AsyncAPIManager, cls).__new__(cls)
         return cls._instance
 
-    def __init__(self, api_key: str=None):
+    def __init__(self,
+                 api_key: str=None,
+                 base_url: str=None,
+                 chunk_size: int=50,
+                 max_concurrency: int=4):
         if not self._is_initialized:
             if not api_key:
                 raise ValueError('AsyncAPIManager should be initialized with an api key first.')
             self.api_key = api_key
+            self.base_url = base_url or self.BASE_URL
+            self.chunk_size = chunk_size
+            self.max_concurrency = max_concurrency
+            self.session: aiohttp.ClientSession | None = None
+            # Symbols of the chunks that failed in the last get_crpyto_prices call.
+            self.failed_symbols: list[str] = []
             self._is_initialized = True
 
+    async def start(self):
+        # One long-lived session, so connections (and their TLS handshakes) and DNS
+        # lookups are reused between requests instead of being redone on every tick.
+        if self.session and not self.session.closed:
+            return
+        connector = aiohttp.TCPConnector(limit=10,
+                                         ttl_dns_cache=20 * 60,
+                                         keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(base_url=self.base_url,
+                                             connector=connector,
+                                             timeout=aiohttp.ClientTimeout(total=30))
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
     async def get_crpyto_prices(self, ctyptos_symbols: list) -> dict:
-        url = f'https://min-api.cryptocompare.com/data/pricemulti?fsyms={",".join(ctyptos_symbols)}&tsyms=USD&api_key={self.api_key}'
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                if resp.status != 200:
-                    raise ConnectionError('A problem happend while fetching the api.')
-                response = await resp.text()
-                return json.loads(response)
+        # Fetches the symbols in chunks, concurrently. A failing chunk is reported and skipped,
+        # only when every chunk fails a ConnectionError is raised.
+        await self.start()
+        chunks = self.split_symbols(ctyptos_symbols)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch(chunk: list[str]) -> dict:
+            async with semaphore:
+                return await self.get_chunk_prices(chunk)
+
+        results = await asyncio.gather(*[fetch(chunk) for chunk in chunks], return_exceptions=True)
+
+        prices = {}
+        self.failed_symbols = []
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, BaseException):
+                print(f'\u001b[31mCould not fetch prices of {",".join(chunk)}.\nDetail: {result!r}\u001b[37m')
+                self.failed_symbols.extend(chunk)
+            else:
+                prices.update(result)
+
+        if chunks and len(self.failed_symbols) == sum(len(chunk) for chunk in chunks):
+            raise ConnectionError('A problem happend while fetching the api.')
+        return prices
+
+    async def get_chunk_prices(self, symbols: list[str]) -> dict:
+        started_at = time.perf_counter()
+        try:
+            prices = await self.fetch_chunk_prices(symbols)
+        except Exception:
+            API_CHUNK_SECONDS.observe(time.perf_counter() - started_at, status='error')
+            raise
+        API_CHUNK_SECONDS.observe(time.perf_counter() - started_at, status='ok')
+        return prices
+
+    async def fetch_chunk_prices(self, symbols: list[str]) -> dict:
+        params = {'fsyms': ','.join(symbols), 'tsyms': 'USD', 'api_key': self.api_key}
+        async with self.session.get('/data/pricemulti', params=params) as resp:
+            if resp.status != 200:
+                raise ConnectionError(f'A problem happend while fetching the api. Status: {resp.status}')
+            data = await resp.json()
+            # CryptoCompare reports errors with a 200 status and a "Response": "Error" body.
+            if data.get('Response') == 'Error':
+                raise ConnectionError(data.get('Message', 'Unknown api error.'))
+            return data
 
+    def split_symbols(self, symbols: list[str]) -> list[list[str]]:
+        chunks = []
+        chunk, chunk_length = [], 0
+        for symbol in symbols:
+            # +1 for the comma that joins the symbols.
+            if chunk and (len(chunk) >= self.chunk_size or chunk_length + len(symbol) + 1 > self.MAX_FSYMS_LENGTH):
+                chunks.append(chunk)
+                chunk, chunk_length = [], 0
+            chunk.append(symbol)
+            chunk_length += len(symbol) + 1
+        if chunk:
+            chunks.append(chunk)
+        return chunks
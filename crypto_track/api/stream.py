@@ -0,0 +1,128 @@
+import asyncio
+import json
+import random
+from datetime import datetime, timezone
+from typing import Optional
+import aiohttp
+from crypto_track.catalog import crypto_catalog
+from crypto_track.coordination import NodeCoordinator
+from crypto_track.database.manager import AsyncDatabaseManager
+from crypto_track.price_cache import latest_prices
+
+
+class AsyncPriceStreamer:
+    # Keeps the latest price cache current from CryptoCompare's websocket stream. Prices are
+    # coalesced in memory and written to the database once every flush_interval seconds, not per message.
+
+    STREAM_URL = 'wss://streamer.cryptocompare.com/v2'
+    # Message types of the stream, see https://min-api.cryptocompare.com/documentation/websockets
+    TYPE_AGGREGATE_INDEX = '5'
+    TYPE_STREAMER_WELCOME = '20'
+    TYPE_HEARTBEAT = '999'
+    ERROR_TYPES = {'401', '429', '500'}
+
+    def __init__(self,
+                 api_key: str,
+                 url: Optional[str] = None,
+                 flush_interval: float = 60,
+                 min_backoff: float = 1,
+                 max_backoff: float = 60):
+        self.api_key = api_key
+        self.url = url or self.STREAM_URL
+        self.flush_interval = flush_interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.subscribed_symbols: set[str] = set()
+        # symbol -> latest price received since the last flush
+        self._pending_prices: dict[str, float] = {}
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._running = False
+
+    async def run(self):
+        self._running = True
+        flush_task = asyncio.create_task(self._flush_loop())
+        backoff = self.min_backoff
+        try:
+            async with aiohttp.ClientSession() as session:
+                while self._running:
+                    try:
+                        async with session.ws_connect(self.url,
+                                                      params={'api_key': self.api_key},
+                                                      heartbeat=30) as ws:
+                            self._ws = ws
+                            self.subscribed_symbols = set()
+                            await self.subscribe_new_symbols()
+                            async for message in ws:
+                                if message.type != aiohttp.WSMsgType.TEXT:
+                                    break
+                                if await self.handle_message(json.loads(message.data)):
+                                    backoff = self.min_backoff
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as ex:
+                        print(f'\u001b[31mPrice stream disconnected.\nDetail: {ex!r}\u001b[37m')
+                    finally:
+                        self._ws = None
+
+                    if self._running:
+                        # Exponential backoff with jitter, so reconnects don't hammer the server.
+                        await asyncio.sleep(random.uniform(backoff / 2, backoff))
+                        backoff = min(backoff * 2, self.max_backoff)
+        finally:
+            flush_task.cancel()
+            await asyncio.gather(flush_task, return_exceptions=True)
+            await self.flush()
+
+    def stop(self):
+        self._running = False
+        if self._ws is not None:
+            asyncio.create_task(self._ws.close())
+
+    async def handle_message(self, data: dict) -> bool:
+        # Returns True for messages that show the connection is healthy.
+        message_type = data.get('TYPE')
+        if message_type == self.TYPE_AGGREGATE_INDEX:
+            # Aggregate index updates without PRICE only carry volume changes.
+            symbol, price = data.get('FROMSYMBOL'), data.get('PRICE')
+            if symbol and price:
+                self._pending_prices[symbol] = price
+                crypto = await crypto_catalog.get_crypto_by_symbol(symbol)
+                if crypto:
+                    latest_prices.set_price(crypto.id, price)
+            return True
+        if message_type in (self.TYPE_STREAMER_WELCOME, self.TYPE_HEARTBEAT):
+            return True
+        if message_type in self.ERROR_TYPES:
+            print(f'\u001b[31mPrice stream error: {data.get("MESSAGE")} {data.get("INFO", "")}\u001b[37m')
+        return False
+
+    async def subscribe_new_symbols(self):
+        if self._ws is None or self._ws.closed:
+            return
+        symbols = set(await AsyncDatabaseManager().get_all_crypto_symbols())
+        new_symbols = symbols - self.subscribed_symbols
+        if new_symbols:
+            await self._ws.send_json({'action': 'SubAdd',
+                                      'subs': [f'5~CCCAGG~{symbol}~USD' for symbol in sorted(new_symbols)]})
+            self.subscribed_symbols |= new_symbols
+
+    async def flush(self) -> dict[int, float]:
+        if not self._pending_prices:
+            return {}
+        pending_prices, self._pending_prices = self._pending_prices, {}
+        # Every node streams into its own cache, only the leader stores the prices.
+        if not await NodeCoordinator().is_leader():
+            return {}
+        updated_prices = await AsyncDatabaseManager().update_cryptos_prices_by_symbol(data=pending_prices)
+        latest_prices.set_prices(updated_prices, updated_at=datetime.now(timezone.utc))
+        return updated_prices
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                # Cryptos added from the CLI get subscribed without reconnecting.
+                await self.subscribe_new_symbols()
+            except Exception as ex:
+                print(f'\u001b[31mException happend while flushing streamed prices.\nDetail:{ex}\u001b[37m')
@@ -1,5 +1,7 @@
 import os
 from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from dotenv import load_dotenv
 
@@ -7,4 +9,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 BOT_TOKEN = os.getenv('BOT_TOKEN')
-bot = Bot(BOT_TOKEN, parse_mode=ParseMode.HTML)
+# Lets the bot talk to a local Bot API server (or the fake one in bench/) instead of api.telegram.org.
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(BOT_TOKEN, session=session, parse_mode=ParseMode.HTML)
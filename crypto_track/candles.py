@@ -0,0 +1,28 @@
+import os
+from datetime import timedelta
+from crypto_track.database.manager import AsyncDatabaseManager, CANDLES_BACKFILL, as_utc, calculate_bucket_start
+from crypto_track.enums import Resolution
+from crypto_track.coordination import NodeCoordinator
+
+# Stored prices are folded into their hourly and daily candles by AsyncDatabaseManager as they are
+# stored. This job folds the prices stored before that, a batch of days per transaction.
+
+
+async def backfill_candles(batch_days: int = None, max_batches: int = 30) -> int:
+    # Resumable, the cursor moves with every batch and a run stops after max_batches.
+    if not await NodeCoordinator().is_leader():
+        return 0
+    batch = timedelta(days=batch_days or int(os.getenv('CANDLES_BACKFILL_BATCH_DAYS', 1)))
+    folded = 0
+    try:
+        for _ in range(max_batches):
+            cursor = await AsyncDatabaseManager().get_backfill_cursor(CANDLES_BACKFILL)
+            if cursor is None or as_utc(cursor.position) >= as_utc(cursor.end_at):
+                break
+            end = min(calculate_bucket_start(cursor.position, Resolution.DAY) + batch, as_utc(cursor.end_at))
+            batch_prices = await AsyncDatabaseManager().backfill_candles(cursor=cursor, end=end)
+            folded += batch_prices
+            print(f'Candles backfilled up to {end:%Y-%m-%d %H:%M}. prices={batch_prices}')
+    except Exception as ex:
+        print(f'\u001b[31mException happend while backfilling candles.\nDetail:{ex}\u001b[37m')
+    return folded
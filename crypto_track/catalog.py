@@ -0,0 +1,139 @@
+import asyncio
+from bisect import bisect_left
+from math import ceil
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from crypto_track.database.manager import AsyncDatabaseManager
+from crypto_track.database.models import Crypto
+
+# Telegram keeps inline keyboards small, so the selection keyboard is paged.
+CRYPTOS_PER_PAGE = 8
+
+with open('messages/catalog/crypto_filter.txt', 'r', encoding='utf-8') as file:
+    crypto_filter_text = file.read()
+
+
+class CryptoCatalog:
+    # In memory copy of the cryptos table with prebuilt selection keyboard rows, so tapping a
+    # crypto in the selection keyboard doesn't need a database round-trip.
+    # The CLI runs in its own process, so besides invalidate() the catalog also reloads itself
+    # once it is older than max_age.
+
+    def __init__(self, max_age: timedelta = timedelta(minutes=1)):
+        self.max_age = max_age
+        self.loaded_at: Optional[datetime] = None
+        self._cryptos: List[Crypto] = []
+        self._by_id: dict[int, Crypto] = {}
+        # Same cryptos sorted by symbol, for prefix search.
+        self._by_symbol: List[Crypto] = []
+        self._symbols: List[str] = []
+        # callback prefix -> crypto id -> (row when not selected, row when selected)
+        self._rows: dict[str, dict[int, tuple[list, list]]] = {}
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self.loaded_at = None
+
+    def is_stale(self) -> bool:
+        return self.loaded_at is None or datetime.now(timezone.utc) - self.loaded_at > self.max_age
+
+    async def get_cryptos(self) -> List[Crypto]:
+        await self._ensure_loaded()
+        return self._cryptos
+
+    async def get_cryptos_by_id(self) -> dict[int, Crypto]:
+        await self._ensure_loaded()
+        return self._by_id
+
+    async def get_crypto_by_symbol(self, symbol: str) -> Optional[Crypto]:
+        await self._ensure_loaded()
+        symbol = symbol.upper()
+        index = bisect_left(self._symbols, symbol)
+        if index < len(self._symbols) and self._symbols[index] == symbol:
+            return self._by_symbol[index]
+        return None
+
+    async def get_selection_keyboard(self,
+                                     callback_prefix: str,
+                                     done_callback_data: str,
+                                     selected_ids: Iterable[int],
+                                     page: int = 0,
+                                     symbol_prefix: Optional[str] = None) -> InlineKeyboardMarkup:
+        # One page of the (optionally filtered by symbol prefix) cryptos, so the keyboard size
+        # doesn't depend on the catalog size. Crypto buttons carry their page in the callback data
+        # ("<prefix>:<crypto id>:<page>"), page buttons send "<prefix>_page:<page>".
+        await self._ensure_loaded()
+        selected_ids = set(selected_ids)
+        cryptos = self._filter_by_symbol(symbol_prefix) if symbol_prefix else self._cryptos
+
+        pages = max(1, ceil(len(cryptos) / CRYPTOS_PER_PAGE))
+        page = min(max(page, 0), pages - 1)
+        page_cryptos = cryptos[page * CRYPTOS_PER_PAGE:(page + 1) * CRYPTOS_PER_PAGE]
+
+        if symbol_prefix:
+            buttons = [build_crypto_row(callback_prefix, crypto, page, crypto.id in selected_ids)
+                       for crypto in page_cryptos]
+        else:
+            rows = self._get_rows(callback_prefix)
+            buttons = [rows[crypto.id][crypto.id in selected_ids] for crypto in page_cryptos]
+
+        if pages > 1:
+            navigation = []
+            if page > 0:
+                navigation.append(InlineKeyboardButton(text="◀️", callback_data=f"{callback_prefix}_page:{page - 1}"))
+            navigation.append(InlineKeyboardButton(text=f"{page + 1}/{pages}", callback_data=f"{callback_prefix}_page:{page}"))
+            if page < pages - 1:
+                navigation.append(InlineKeyboardButton(text="▶️", callback_data=f"{callback_prefix}_page:{page + 1}"))
+            buttons.append(navigation)
+        if symbol_prefix:
+            buttons.append([InlineKeyboardButton(text=f"❌ حذف فیلتر {symbol_prefix}",
+                                                 callback_data=f"{callback_prefix}_clear_filter")])
+        buttons.append([InlineKeyboardButton(text="✅ پایان", callback_data=done_callback_data)])
+
+        return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+    async def _ensure_loaded(self):
+        if not self.is_stale():
+            return
+        async with self._lock:
+            # Another handler may have reloaded it while we were waiting.
+            if not self.is_stale():
+                return
+            self._cryptos = sorted(await AsyncDatabaseManager().get_all_cryptos(), key=lambda crypto: crypto.id)
+            self._by_id = {crypto.id: crypto for crypto in self._cryptos}
+            self._by_symbol = sorted(self._cryptos, key=lambda crypto: (crypto.symbol or '').upper())
+            self._symbols = [(crypto.symbol or '').upper() for crypto in self._by_symbol]
+            self._rows = {}
+            self.loaded_at = datetime.now(timezone.utc)
+
+    def _filter_by_symbol(self, symbol_prefix: str) -> List[Crypto]:
+        symbol_prefix = symbol_prefix.upper()
+        start = bisect_left(self._symbols, symbol_prefix)
+        end = bisect_left(self._symbols, symbol_prefix + '\uffff', lo=start)
+        return self._by_symbol[start:end]
+
+    def _get_rows(self, callback_prefix: str) -> dict[int, tuple[list, list]]:
+        rows = self._rows.get(callback_prefix)
+        if rows is None:
+            rows = {}
+            for index, crypto in enumerate(self._cryptos):
+                page = index // CRYPTOS_PER_PAGE
+                rows[crypto.id] = (build_crypto_row(callback_prefix, crypto, page, selected=False),
+                                   build_crypto_row(callback_prefix, crypto, page, selected=True))
+            self._rows[callback_prefix] = rows
+        return rows
+
+
+def parse_crypto_selection_data(callback_data: str) -> tuple[int, int]:
+    # "<prefix>:<crypto id>:<page>", keyboards sent before paging existed have no page.
+    parts = callback_data.split(':')
+    return int(parts[1]), int(parts[2]) if len(parts) > 2 else 0
+
+
+def build_crypto_row(callback_prefix: str, crypto: Crypto, page: int, selected: bool) -> list:
+    text = f"{'✔️ ' if selected else ''}{crypto.name}"
+    return [InlineKeyboardButton(text=text, callback_data=f"{callback_prefix}:{crypto.id}:{page}")]
+
+
+crypto_catalog = CryptoCatalog()
@@ -0,0 +1,28 @@
+import io
+import numpy as np
+
+# Runs in the worker processes of ChartService, matplotlib is only imported there.
+
+
+def render_price_chart(title: str, dates: np.ndarray, prices: np.ndarray) -> bytes:
+    from matplotlib.dates import AutoDateLocator, ConciseDateFormatter
+    from matplotlib.figure import Figure
+
+    # A Figure without pyplot, nothing global is kept between renders.
+    figure = Figure(figsize=(8, 4.5), dpi=100)
+    axes = figure.subplots()
+    color = '#16a34a' if prices[-1] >= prices[0] else '#dc2626'
+    axes.plot(dates, prices, color=color, linewidth=1.6)
+    axes.fill_between(dates, prices, prices.min(), color=color, alpha=0.12)
+    axes.set_title(title)
+    axes.set_ylabel('USD')
+    axes.grid(alpha=0.3)
+    axes.margins(x=0)
+    locator = AutoDateLocator()
+    axes.xaxis.set_major_locator(locator)
+    axes.xaxis.set_major_formatter(ConciseDateFormatter(locator))
+    figure.tight_layout()
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png')
+    return buffer.getvalue()
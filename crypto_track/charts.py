@@ -0,0 +1,123 @@
+import asyncio
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from aiogram import Bot
+from aiogram.types import BufferedInputFile
+from crypto_track.chart_render import render_price_chart
+from crypto_track.database.manager import as_utc
+from crypto_track.database.models import Crypto
+from crypto_track.history import HISTORY_WINDOWS, load_price_series
+from crypto_track.metrics import CHARTS, CHART_RENDER_SECONDS
+
+_MISSING = object()
+
+
+class ChartService:
+    # Sends price charts as photos. Charts are rendered in a process pool, off the event loop, and
+    # the file_id of the first upload of a chart is reused for every later request of the same
+    # (crypto, window, price version). The version is the stored last_price_at of the crypto, so it
+    # changes with every price update and is the same in every process.
+    # Requests for a chart that is being rendered wait for it instead of rendering it again.
+    _instance = None
+    _is_initialized = False
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(ChartService, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, workers: int = 2, max_entries: int = 1024, no_data_ttl: timedelta = timedelta(minutes=1)):
+        if not self._is_initialized:
+            self.workers = workers
+            self.max_entries = max_entries
+            # Charts without enough prices to draw are only remembered for no_data_ttl.
+            self.no_data_ttl = no_data_ttl
+            self._executor: Optional[ProcessPoolExecutor] = None
+            # (file_id, expires_at) per chart, file_id is None for charts without enough prices to draw.
+            self._file_ids: OrderedDict[tuple[int, str, float], tuple[Optional[str], Optional[datetime]]] = OrderedDict()
+            self._in_flight: dict[tuple[int, str, float], asyncio.Future] = {}
+            self._is_initialized = True
+
+    async def send_chart(self, bot: Bot, chat_id: int, crypto: Crypto, window: str, caption: str) -> bool:
+        # Returns False when there are not enough prices in the window to draw a chart.
+        # The crypto has to be freshly loaded from the database, for its last_price_at.
+        key = (crypto.id, window, as_utc(crypto.last_price_at).timestamp() if crypto.last_price_at else 0.0)
+        while True:
+            file_id = self._get_file_id(key)
+            if file_id is not _MISSING:
+                break
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                return await self._render_and_send(key, bot, chat_id, crypto, window, caption)
+            # Resolved once the render finished (or failed, then this request renders it).
+            await asyncio.shield(in_flight)
+
+        if file_id is None:
+            CHARTS.inc(result='no_data')
+            return False
+        await bot.send_photo(chat_id, photo=file_id, caption=caption)
+        CHARTS.inc(result='cached')
+        return True
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _render_and_send(self, key: tuple, bot: Bot, chat_id: int, crypto: Crypto, window: str, caption: str) -> bool:
+        in_flight = self._in_flight[key] = asyncio.get_running_loop().create_future()
+        try:
+            png = await self._render(crypto, window)
+            if png is None:
+                self._put_file_id(key, None)
+                CHARTS.inc(result='no_data')
+                return False
+            message = await bot.send_photo(chat_id,
+                                           photo=BufferedInputFile(png, filename=f'{crypto.symbol}_{window}.png'),
+                                           caption=caption)
+            self._put_file_id(key, message.photo[-1].file_id)
+            CHARTS.inc(result='rendered')
+            return True
+        finally:
+            del self._in_flight[key]
+            in_flight.set_result(None)
+
+    async def _render(self, crypto: Crypto, window: str) -> Optional[bytes]:
+        length, resolution = HISTORY_WINDOWS[window]
+        now = datetime.now(timezone.utc)
+        series = (await load_price_series([crypto.id], start=now - length, end=now, resolution=resolution)).get(crypto.id)
+        if series is None or len(series.prices) < 2:
+            return None
+        with CHART_RENDER_SECONDS.time():
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(),
+                                                                    render_price_chart,
+                                                                    f'{crypto.name} ({crypto.symbol}) - {window}',
+                                                                    series.dates,
+                                                                    series.prices)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned, not forked, so the workers don't inherit the event loop and connections.
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def _get_file_id(self, key: tuple):
+        entry = self._file_ids.get(key)
+        if entry is None:
+            return _MISSING
+        file_id, expires_at = entry
+        if expires_at is not None and datetime.now(timezone.utc) >= expires_at:
+            del self._file_ids[key]
+            return _MISSING
+        self._file_ids.move_to_end(key)
+        return file_id
+
+    def _put_file_id(self, key: tuple, file_id: Optional[str]):
+        expires_at = datetime.now(timezone.utc) + self.no_data_ttl if file_id is None else None
+        self._file_ids[key] = (file_id, expires_at)
+        self._file_ids.move_to_end(key)
+        while len(self._file_ids) > self.max_entries:
+            self._file_ids.popitem(last=False)
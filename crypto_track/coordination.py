@@ -0,0 +1,47 @@
+import os
+import socket
+from datetime import timedelta
+from typing import Optional
+from crypto_track.database.manager import AsyncDatabaseManager
+
+LEADER_LEASE = 'leader'
+
+
+class NodeCoordinator:
+    # Coordinates bot processes (nodes) sharing one database:
+    #   - The node holding the leader lease fetches prices, checks alerts and compacts prices.
+    #     The lease is renewed on every job run and taken over by another node once it expires.
+    #   - Every node delivers the price updates of its own shard of users (user id % node_count).
+    _instance = None
+    _is_initialized = False
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(NodeCoordinator, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self,
+                 node_count: int = 1,
+                 node_index: int = 0,
+                 lease_ttl: timedelta = timedelta(minutes=15)):
+        if not self._is_initialized:
+            if not 0 <= node_index < node_count:
+                raise ValueError(f'NODE_INDEX should be between 0 and {node_count - 1}.')
+            self.node_count = node_count
+            self.node_index = node_index
+            # Longer than the update job interval, so the leader keeps the lease between runs.
+            self.lease_ttl = lease_ttl
+            self.holder = f'{socket.gethostname()}:{os.getpid()}:{node_index}'
+            self._is_initialized = True
+
+    @property
+    def shard(self) -> Optional[tuple[int, int]]:
+        if self.node_count == 1:
+            return None
+        return self.node_count, self.node_index
+
+    async def is_leader(self) -> bool:
+        return await AsyncDatabaseManager().acquire_lease(name=LEADER_LEASE, holder=self.holder, ttl=self.lease_ttl)
+
+    async def release(self):
+        await AsyncDatabaseManager().release_lease(name=LEADER_LEASE, holder=self.holder)
@@ -1,6 +1,7 @@
 from aiogram import Router, F
 from aiogram.types import (Message, ReplyKeyboardRemove)
 from crypto_track.database.manager import AsyncDatabaseManager
+from crypto_track.price_cache import get_latest_prices
 
 
 def load_crypto_price_messages():
@@ -22,9 +23,10 @@ async def get_user_crypto_prices(message: Message):
     if not user:
         await message.reply(account_not_exists_text, reply_markup=ReplyKeyboardRemove())
         return
-    crypto_ids = [str(crypto.id) for crypto in user.tracking_cryptos]
-    cryptos_prices = await AsyncDatabaseManager().get_multiple_cryptos_current_price(crypto_ids=crypto_ids)
+    crypto_ids = [crypto.id for crypto in user.tracking_cryptos]
+    cryptos_prices = await get_latest_prices(crypto_ids=crypto_ids)
 
-    prices_formated = [f"🔹{crypto_price.crypto.name}: <code>{crypto_price.price}</code>💲" for crypto_price in cryptos_prices]
+    prices_formated = [f"🔹{crypto.name}: <code>{cryptos_prices[crypto.id]}</code>💲"
+                       for crypto in user.tracking_cryptos if crypto.id in cryptos_prices]
     
     await message.answer(price_list_text.format(cryptos_prices='\n'.join(prices_formated)))
@@ -1,12 +1,60 @@
-from datetime import datetime
-from typing import List, Optional
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from crypto_track.database.models import User, Crypto, Price
+from crypto_track.database.models import (User, Crypto, Price, PriceRollup, PriceAlert, Lease, OutboxMessage,
+                                          BackfillCursor)
 from sqlalchemy.future import select
-from crypto_track.enums import TimeOptions
-from sqlalchemy.orm import selectinload, aliased
-from sqlalchemy import select, func
+from crypto_track.enums import TimeOptions, Resolution, AlertDirection, OutboxStatus
+from crypto_track.metrics import DB_QUERY_SECONDS, time_methods
+from sqlalchemy.orm import selectinload
+from sqlalchemy import select, func, update, case, delete, insert, bindparam, or_
+from sqlalchemy.exc import IntegrityError
 
+
+def calculate_next_due_at(last_update: datetime, how_often: TimeOptions) -> datetime:
+    return last_update + timedelta(minutes=int(how_often.value))
+
+
+# Backfill folding the prices stored before candles were built live, see BackfillCursor.
+CANDLES_BACKFILL = 'candles'
+
+
+def as_utc(date: datetime) -> datetime:
+    # SQLite gives back naive datetimes, which are UTC.
+    return date.astimezone(timezone.utc) if date.tzinfo else date.replace(tzinfo=timezone.utc)
+
+
+def calculate_bucket_start(date: datetime, resolution: Resolution) -> datetime:
+    # Buckets are aligned to UTC hours/days.
+    date = as_utc(date)
+    if resolution == Resolution.DAY:
+        return date.replace(hour=0, minute=0, second=0, microsecond=0)
+    return date.replace(minute=0, second=0, microsecond=0)
+
+
+def fold_into_candle(candles: dict, key: tuple, open, high, low, close, count: int):
+    # Rows have to be folded in chronological order for open/close to be right.
+    candle = candles.get(key)
+    if candle is None:
+        candles[key] = [open, high, low, close, count]
+        return
+    candle[1] = max(candle[1], high)
+    candle[2] = min(candle[2], low)
+    candle[3] = close
+    candle[4] += count
+
+
+def mark_users_updated_query(user_ids: List[int], timestamp: datetime):
+    next_due_at = case(
+        *[(User.how_often == time_option, calculate_next_due_at(timestamp, time_option))
+          for time_option in TimeOptions],
+        else_=timestamp
+    )
+    return update(User).where(User.id.in_(user_ids)) \
+                       .values(last_update=timestamp, next_due_at=next_due_at)
+
+
+@time_methods(DB_QUERY_SECONDS)
 class AsyncDatabaseManager:
     _instance = None
     _is_initialized = False
@@ -28,7 +76,9 @@ class AsyncDatabaseManager:
                           user_name: str, 
                           how_often: TimeOptions) -> User:
         async with self.async_session() as session:
-            new_user = User(id=user_id, name=user_name, how_often=how_often)
+            now = datetime.now(timezone.utc)
+            new_user = User(id=user_id, name=user_name, how_often=how_often,
+                            last_update=now, next_due_at=calculate_next_due_at(now, how_often))
             session.add(new_user)
             await session.commit()
 
@@ -40,7 +90,9 @@ class AsyncDatabaseManager:
                                             how_often: TimeOptions, 
                                             cryptos_to_add_ids: List[str]) -> User:
         async with self.async_session() as session:
-            new_user = User(id=user_id, name=user_name, how_often=how_often)
+            now = datetime.now(timezone.utc)
+            new_user = User(id=user_id, name=user_name, how_often=how_often,
+                            last_update=now, next_due_at=calculate_next_due_at(now, how_often))
             
             cryptos = await session.execute(select(Crypto).filter(Crypto.id.in_(cryptos_to_add_ids)))
             cryptos_list = cryptos.scalars().all()
@@ -72,6 +124,9 @@ class AsyncDatabaseManager:
             if new_last_update:
                 user.last_update = new_last_update
 
+            if new_how_often or new_last_update:
+                user.next_due_at = calculate_next_due_at(user.last_update, user.how_often)
+
             await session.commit()
             return user
 
@@ -150,6 +205,11 @@ class AsyncDatabaseManager:
             crypto = result.scalars().first()
             
             if crypto:
+                # Candles and alerts have no relationship on Crypto, so the delete would leave them behind,
+                # and the prices would be kept with a NULL crypto_id.
+                await session.execute(delete(Price).where(Price.crypto_id == crypto.id))
+                await session.execute(delete(PriceRollup).where(PriceRollup.crypto_id == crypto.id))
+                await session.execute(delete(PriceAlert).where(PriceAlert.crypto_id == crypto.id))
                 await session.delete(crypto)
                 await session.commit()
                 return True
@@ -168,20 +228,47 @@ class AsyncDatabaseManager:
             users = result.scalars().all()
             
             return users
+
+    async def get_due_users(self,
+                            now: datetime,
+                            limit: Optional[int] = None,
+                            after_id: Optional[int] = None,
+                            shard: Optional[tuple[int, int]] = None) -> List[User]:
+        # Users whose next update is due at `now`, ordered by id so callers can page with `after_id`.
+        # With shard=(count, index) only users with id % count == index are returned.
+        async with self.async_session() as session:
+            query = select(User).options(selectinload(User.tracking_cryptos)) \
+                                .filter(User.next_due_at <= now).order_by(User.id)
+            if after_id is not None:
+                query = query.filter(User.id > after_id)
+            if shard is not None:
+                shard_count, shard_index = shard
+                query = query.filter(User.id % shard_count == shard_index)
+            if limit:
+                query = query.limit(limit)
+
+            result = await session.execute(query)
+            users = result.scalars().all()
+
+            return users
         
     async def create_new_crypto(self,
                             crypto_name: str, 
                             symbol: str,
                             current_price: float) -> Crypto:
         async with self.async_session() as session:
+            now = datetime.now(timezone.utc)
             new_crypto = Crypto(name=crypto_name,
-                                symbol=symbol)
+                                symbol=symbol,
+                                last_price=current_price,
+                                last_price_at=now)
         
             session.add(new_crypto)
             await session.flush()
 
-            new_price = Price(crypto_id=new_crypto.id, price=current_price)
+            new_price = Price(crypto_id=new_crypto.id, price=current_price, date=now)
             session.add(new_price)
+            await self._fold_into_current_candles(session, {new_crypto.id: current_price}, now)
 
             await session.commit()
 
@@ -195,95 +282,521 @@ class AsyncDatabaseManager:
             
             return cryptos
     
-    async def get_crypto_all_prices(self,
-                            crypto_id: str) -> List[Price]:
+    async def get_all_crypto_symbols(self) -> List[str]:
         async with self.async_session() as session:
-            query = select(Price).filter(Price.crypto_id == crypto_id)
-            result = await session.execute(query)
-            prices = result.scalars().all()
-            return prices
-        
-    async def delete_all_prices_of_crypto(self, crypto_id=str) -> bool:
+            result = await session.execute(select(Crypto.symbol))
+            return result.scalars().all()
+
+    async def stream_price_history(self,
+                                   crypto_ids: List[int],
+                                   start: datetime,
+                                   end: datetime,
+                                   resolution: Optional[Resolution] = None,
+                                   chunk_size: int = 5000) -> AsyncIterator[list]:
+        # Yields chunks of (crypto_id, date, price) rows ordered by crypto and date, without loading
+        # the whole range at once. Without a resolution the raw prices are read, otherwise the close
+        # prices of the candles.
+        if resolution is None:
+            query = select(Price.crypto_id, Price.date, Price.price) \
+                    .where(Price.crypto_id.in_(crypto_ids), Price.date >= start, Price.date < end) \
+                    .order_by(Price.crypto_id, Price.date)
+        else:
+            query = select(PriceRollup.crypto_id, PriceRollup.bucket_start, PriceRollup.close) \
+                    .where(PriceRollup.crypto_id.in_(crypto_ids),
+                           PriceRollup.resolution == resolution,
+                           PriceRollup.bucket_start >= start,
+                           PriceRollup.bucket_start < end) \
+                    .order_by(PriceRollup.crypto_id, PriceRollup.bucket_start)
+
         async with self.async_session() as session:
-            query = select(Price).filter(Price.crypto_id == crypto_id)
-            result = await session.execute(query)
-            prices = result.scalars().all()
+            result = await session.stream(query.execution_options(yield_per=chunk_size))
+            async for rows in result.partitions(chunk_size):
+                yield rows
+
+    async def stream_users(self, chunk_size: int = 5000) -> AsyncIterator[List[User]]:
+        # Yields the users with their tracked cryptos a chunk at a time, from a server side cursor.
+        async with self.async_session() as session:
+            result = await session.stream_scalars(
+                select(User).options(selectinload(User.tracking_cryptos)).order_by(User.id)
+                            .execution_options(yield_per=chunk_size)
+            )
+            async for users in result.partitions(chunk_size):
+                yield users
+
+    async def stream_cryptos(self, chunk_size: int = 5000) -> AsyncIterator[List[Crypto]]:
+        async with self.async_session() as session:
+            result = await session.stream_scalars(select(Crypto).order_by(Crypto.id).execution_options(yield_per=chunk_size))
+            async for cryptos in result.partitions(chunk_size):
+                yield cryptos
 
-            if not prices:
+    async def stream_prices(self, chunk_size: int = 5000) -> AsyncIterator[list]:
+        # Yields chunks of (symbol, date, price) rows of every raw price, ordered by crypto and date.
+        async with self.async_session() as session:
+            result = await session.stream(
+                select(Crypto.symbol, Price.date, Price.price).join(Price.crypto)
+                                                              .order_by(Price.crypto_id, Price.date)
+                                                              .execution_options(yield_per=chunk_size)
+            )
+            async for rows in result.partitions(chunk_size):
+                yield rows
+
+    async def import_cryptos(self, rows: List[dict]) -> int:
+        # Inserts the cryptos (name, symbol, last_price, last_price_at) whose symbol is not stored yet.
+        async with self.async_session() as session:
+            result = await session.execute(select(Crypto.symbol).where(Crypto.symbol.in_([row['symbol'] for row in rows])))
+            existing_symbols = set(result.scalars())
+            new_rows = {row['symbol']: row for row in rows if row['symbol'] not in existing_symbols}
+            if new_rows:
+                await session.execute(insert(Crypto.__table__), list(new_rows.values()))
+            await session.commit()
+            return len(new_rows)
+
+    async def import_prices(self, rows: List[dict]) -> int:
+        # Inserts historical prices (crypto_id, date, price) and folds them into their candles, in
+        # one transaction. Stored candles of the same buckets are taken to hold newer prices, as when
+        # seeding the history from before the bot tracked a crypto, so the imported prices go before
+        # them. Callers have to pass every price of a bucket in the same call.
+        # Prices whose (crypto_id, date) is already stored are skipped, so importing a file again
+        # changes nothing. Returns the number of inserted prices.
+        if not rows:
+            return 0
+        async with self.async_session() as session:
+            dates = [row['date'] for row in rows]
+            result = await session.execute(
+                select(Price.crypto_id, Price.date).where(Price.crypto_id.in_({row['crypto_id'] for row in rows}),
+                                                          Price.date >= min(dates),
+                                                          Price.date <= max(dates))
+            )
+            new_rows = {}
+            stored_keys = {(crypto_id, as_utc(date)) for crypto_id, date in result}
+            for row in rows:
+                key = (row['crypto_id'], as_utc(row['date']))
+                if key not in stored_keys:
+                    new_rows.setdefault(key, row)
+            if not new_rows:
+                return 0
+            await session.execute(insert(Price.__table__), list(new_rows.values()))
+            inserted = len(new_rows)
+
+            # Prices in the range the candles backfill has not reached yet are folded by it, not here.
+            # Locking the cursor after the insert keeps a backfill batch from moving past them unseen.
+            result = await session.execute(select(BackfillCursor).where(BackfillCursor.name == CANDLES_BACKFILL)
+                                                                 .with_for_update())
+            cursor = result.scalars().first()
+            if cursor is not None and as_utc(cursor.position) < as_utc(cursor.end_at):
+                backfill_start, backfill_end = as_utc(cursor.position), as_utc(cursor.end_at)
+                new_rows = {key: row for key, row in new_rows.items() if not backfill_start <= key[1] < backfill_end}
+
+            candles = {resolution: {} for resolution in Resolution}
+            for _, row in sorted(new_rows.items(), key=lambda item: item[0]):
+                price = row['price']
+                for resolution, resolution_candles in candles.items():
+                    key = (row['crypto_id'], calculate_bucket_start(row['date'], resolution))
+                    fold_into_candle(resolution_candles, key, price, price, price, price, 1)
+            for resolution, resolution_candles in candles.items():
+                await self._merge_older_candles(session, resolution_candles, resolution)
+            await session.commit()
+            return inserted
+
+    async def delete_all_prices_of_crypto(self, crypto_id=str) -> bool:
+        # Returns False when the crypto does not exist. Retention may have deleted its raw prices
+        # already, the candles and the latest price are reset either way.
+        async with self.async_session() as session:
+            result = await session.execute(update(Crypto).where(Crypto.id == crypto_id)
+                                                         .values(last_price=None, last_price_at=None))
+            if not result.rowcount:
                 return False
-            
-            for price in prices:
-                await session.delete(price)
-            
+
+            await session.execute(delete(Price).where(Price.crypto_id == crypto_id))
+            await session.execute(delete(PriceRollup).where(PriceRollup.crypto_id == crypto_id))
             await session.commit()
             return True
 
     async def get_crypto_current_price(self,
-                                   crypto_id: str) -> Price:
+                                   crypto_id: str) -> Crypto | None:
+        # The returned crypto carries its latest price in last_price/last_price_at.
         async with self.async_session() as session:
-            query = select(Price).filter(Price.crypto_id == crypto_id). \
-                                                order_by(Price.date.desc()).limit(1)
+            query = select(Crypto).filter(Crypto.id == crypto_id, Crypto.last_price.is_not(None))
             result = await session.execute(query)
-            current_price = result.scalars().first()
+            crypto = result.scalars().first()
 
-            return current_price
+            return crypto
     
-    async def get_multiple_cryptos_current_price(self, crypto_ids: List[str] = None):
+    async def get_multiple_cryptos_current_price(self, crypto_ids: List[str] = None) -> List[Crypto]:
+        # Cryptos (all of them, or only crypto_ids) that have a price, with it in last_price/last_price_at.
         async with self.async_session() as session:
-            # Subquery to find the latest price date for each of the specified crypto_ids  
+            query = select(Crypto).filter(Crypto.last_price.is_not(None))
             if crypto_ids:
-                latest_price_subquery = select(
-                    Price.crypto_id,
-                    func.max(Price.date).label('max_date')
-                ).where(Price.crypto_id.in_(crypto_ids)).group_by(Price.crypto_id).subquery('latest_price')
-            else:
-                latest_price_subquery = select(
-                        Price.crypto_id,
-                        func.max(Price.date).label('max_date')
-                    ).group_by(Price.crypto_id).subquery('latest_price')
-
-            # Aliasing the Price table to join with the subquery
-            latest_price = aliased(Price)
-
-            # Query to select the prices that match the latest date found for each specified crypto
-            query = (
-                select(Price)
-                .join(
-                    latest_price_subquery,
-                    (Price.crypto_id == latest_price_subquery.c.crypto_id) &
-                    (Price.date == latest_price_subquery.c.max_date)
-                ).options(selectinload(Price.crypto))
-            )
+                query = query.filter(Crypto.id.in_(crypto_ids))
 
             result = await session.execute(query)
-            current_prices = result.scalars().all()
+            cryptos = result.scalars().all()
 
-            return current_prices
+            return cryptos
     
     async def add_new_price(self, 
                         crypto_id: str,
                         new_price: float) -> Price:
 
         async with self.async_session() as session:
-            new_price = Price(crypto_id=crypto_id, price=new_price)
+            now = datetime.now(timezone.utc)
+            new_price = Price(crypto_id=crypto_id, price=new_price, date=now)
             session.add(new_price)
+            await session.execute(update(Crypto).where(Crypto.id == crypto_id)
+                                                .values(last_price=new_price.price, last_price_at=now))
+            await self._fold_into_current_candles(session, {crypto_id: new_price.price}, now)
             await session.commit()
             return new_price
 
     async def update_cryptos_prices_by_symbol(self,
-                                           data: dict[str, float]) -> list[Crypto]:
+                                           data: dict[str, float]) -> dict[int, float]:
+        # Stores a price for every known symbol in data with Core bulk statements (no ORM objects)
+        # and returns the stored prices by crypto id.
+        if not data:
+            return {}
         async with self.async_session() as session:
-            query = select(Crypto)
+            result = await session.execute(select(Crypto.id, Crypto.symbol).where(Crypto.symbol.in_(data.keys())))
+            now = datetime.now(timezone.utc)
+            rows = [{'crypto_id': crypto_id, 'price': data[symbol], 'date': now}
+                    for crypto_id, symbol in result if data.get(symbol)]
+            if not rows:
+                return {}
+
+            prices_table, cryptos_table = Price.__table__, Crypto.__table__
+            connection = await session.connection()
+            if connection.dialect.insert_executemany_returning:
+                inserted = await session.execute(
+                    insert(prices_table).returning(prices_table.c.crypto_id, prices_table.c.price), rows
+                )
+                updated_prices = {crypto_id: price for crypto_id, price in inserted}
+            else:
+                await session.execute(insert(prices_table), rows)
+                updated_prices = {row['crypto_id']: row['price'] for row in rows}
+
+            await session.execute(
+                update(cryptos_table).where(cryptos_table.c.id == bindparam('b_crypto_id'))
+                                     .values(last_price=bindparam('b_price'), last_price_at=now),
+                [{'b_crypto_id': crypto_id, 'b_price': price} for crypto_id, price in updated_prices.items()]
+            )
+            await self._fold_into_current_candles(session, updated_prices, now)
+            await session.commit()
+
+            return updated_prices
+
+    async def _fold_into_current_candles(self, session: AsyncSession, prices: dict[int, float], date: datetime):
+        # Folds prices stored at `date` into the hourly and daily candles of their crypto, only the
+        # current bucket of each resolution is read and written.
+        bucket_starts = {resolution: calculate_bucket_start(date, resolution) for resolution in Resolution}
+        result = await session.execute(
+            select(PriceRollup.crypto_id, PriceRollup.resolution).where(
+                PriceRollup.crypto_id.in_(prices.keys()),
+                or_(*[(PriceRollup.resolution == resolution) & (PriceRollup.bucket_start == bucket_start)
+                      for resolution, bucket_start in bucket_starts.items()])
+            )
+        )
+        existing_candles = set(result.all())
+
+        updated_candles, new_candles = [], []
+        for crypto_id, price in prices.items():
+            for resolution, bucket_start in bucket_starts.items():
+                if (crypto_id, resolution) in existing_candles:
+                    updated_candles.append({'b_crypto_id': crypto_id, 'b_resolution': resolution,
+                                            'b_bucket_start': bucket_start, 'b_price': price})
+                else:
+                    new_candles.append({'crypto_id': crypto_id, 'resolution': resolution, 'bucket_start': bucket_start,
+                                        'open': price, 'high': price, 'low': price, 'close': price, 'count': 1})
+
+        rollups_table = PriceRollup.__table__
+        if updated_candles:
+            price = bindparam('b_price')
+            await session.execute(
+                update(rollups_table).where(rollups_table.c.crypto_id == bindparam('b_crypto_id'),
+                                            rollups_table.c.resolution == bindparam('b_resolution'),
+                                            rollups_table.c.bucket_start == bindparam('b_bucket_start'))
+                                     .values(high=case((rollups_table.c.high < price, price), else_=rollups_table.c.high),
+                                             low=case((rollups_table.c.low > price, price), else_=rollups_table.c.low),
+                                             close=price,
+                                             count=rollups_table.c.count + 1),
+                updated_candles
+            )
+        if new_candles:
+            await session.execute(insert(rollups_table), new_candles)
+
+    async def get_last_price_date(self) -> datetime | None:
+        # When the newest stored price was written.
+        async with self.async_session() as session:
+            result = await session.execute(select(func.max(Crypto.last_price_at)))
+            return result.scalar()
+
+    async def get_oldest_price_date(self, before: datetime) -> datetime | None:
+        async with self.async_session() as session:
+            result = await session.execute(select(func.min(Price.date)).where(Price.date < before))
+            return result.scalar()
+
+    async def get_oldest_rollup_date(self, resolution: Resolution, before: datetime) -> datetime | None:
+        async with self.async_session() as session:
+            result = await session.execute(
+                select(func.min(PriceRollup.bucket_start)).where(PriceRollup.resolution == resolution,
+                                                                 PriceRollup.bucket_start < before)
+            )
+            return result.scalar()
+
+    async def delete_prices(self, start: datetime, end: datetime) -> int:
+        async with self.async_session() as session:
+            deleted = await session.execute(delete(Price).where(Price.date >= start, Price.date < end)
+                                                         .execution_options(synchronize_session=False))
+            await session.commit()
+            return deleted.rowcount
+
+    async def delete_rollups(self, resolution: Resolution, start: datetime, end: datetime) -> int:
+        async with self.async_session() as session:
+            deleted = await session.execute(
+                delete(PriceRollup).where(PriceRollup.resolution == resolution,
+                                          PriceRollup.bucket_start >= start,
+                                          PriceRollup.bucket_start < end)
+                                   .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+            return deleted.rowcount
+
+    async def get_backfill_cursor(self, name: str) -> BackfillCursor | None:
+        async with self.async_session() as session:
+            result = await session.execute(select(BackfillCursor).where(BackfillCursor.name == name))
+            return result.scalars().first()
+
+    async def backfill_candles(self, cursor: BackfillCursor, end: datetime) -> int:
+        # Folds the raw prices in [cursor.position, end) into hourly and daily candles, and the hourly
+        # candles compacted by older versions into daily ones, then moves the cursor to `end`. One
+        # transaction per batch, so an interrupted backfill resumes after the last finished one.
+        # Batches have to cover whole days (but the last one), the buckets a batch writes are then
+        # either new or the buckets around cursor.end_at, which already hold newer, live folded prices.
+        start = cursor.position
+        live_hour_start = calculate_bucket_start(cursor.end_at, Resolution.HOUR)
+        async with self.async_session() as session:
+            moved = await session.execute(
+                update(BackfillCursor).where(BackfillCursor.name == cursor.name, BackfillCursor.position == start)
+                                      .values(position=end)
+            )
+            if not moved.rowcount:
+                # Backfilled by another process in the meantime.
+                return 0
+
+            prices = await session.execute(
+                select(Price.crypto_id, Price.date, Price.price)
+                    .where(Price.date >= start, Price.date < end, Price.price.is_not(None))
+                    .order_by(Price.crypto_id, Price.date)
+            )
+            rows = [(crypto_id, as_utc(date), price, price, price, price, 1) for crypto_id, date, price in prices]
+            hourly_candles = {}
+            for crypto_id, date, *candle in rows:
+                fold_into_candle(hourly_candles, (crypto_id, calculate_bucket_start(date, Resolution.HOUR)), *candle)
+            price_rows = len(rows)
+
+            hourly_rollups = await session.execute(
+                select(PriceRollup.crypto_id, PriceRollup.bucket_start, PriceRollup.open, PriceRollup.high,
+                       PriceRollup.low, PriceRollup.close, PriceRollup.count)
+                    .where(PriceRollup.resolution == Resolution.HOUR,
+                           PriceRollup.bucket_start >= start,
+                           PriceRollup.bucket_start < min(as_utc(end), live_hour_start))
+            )
+            rows += [(crypto_id, as_utc(bucket_start), *candle) for crypto_id, bucket_start, *candle in hourly_rollups]
+            rows.sort(key=lambda row: (row[0], row[1]))
+            daily_candles = {}
+            for crypto_id, date, *candle in rows:
+                fold_into_candle(daily_candles, (crypto_id, calculate_bucket_start(date, Resolution.DAY)), *candle)
+
+            await self._merge_older_candles(session, hourly_candles, Resolution.HOUR)
+            await self._merge_older_candles(session, daily_candles, Resolution.DAY)
+            await session.commit()
+
+            return price_rows
+
+    async def _merge_older_candles(self, session: AsyncSession, candles: dict, resolution: Resolution):
+        # Existing candles hold newer prices of the same bucket, so the given ones are folded before them.
+        if not candles:
+            return
+        crypto_ids = {crypto_id for crypto_id, _ in candles}
+        bucket_starts = [bucket_start for _, bucket_start in candles]
+        query = select(PriceRollup).where(PriceRollup.resolution == resolution,
+                                          PriceRollup.crypto_id.in_(crypto_ids),
+                                          PriceRollup.bucket_start >= min(bucket_starts),
+                                          PriceRollup.bucket_start <= max(bucket_starts))
+        result = await session.execute(query)
+        existing_rollups = {(rollup.crypto_id, calculate_bucket_start(rollup.bucket_start, resolution)): rollup
+                            for rollup in result.scalars()}
+
+        for key, (open, high, low, close, count) in candles.items():
+            rollup = existing_rollups.get(key)
+            if rollup is None:
+                session.add(PriceRollup(crypto_id=key[0], resolution=resolution, bucket_start=key[1],
+                                        open=open, high=high, low=low, close=close, count=count))
+                continue
+            rollup.open = open
+            rollup.high = max(rollup.high, high)
+            rollup.low = min(rollup.low, low)
+            rollup.count += count
+
+    async def create_price_alert(self,
+                                 user_id: int,
+                                 crypto_id: int,
+                                 direction: AlertDirection,
+                                 threshold: float) -> PriceAlert:
+        async with self.async_session() as session:
+            new_alert = PriceAlert(user_id=user_id, crypto_id=crypto_id, direction=direction, threshold=threshold)
+            session.add(new_alert)
+            await session.commit()
+
+            return new_alert
+
+    async def get_user_price_alerts(self, user_id: int) -> List[PriceAlert]:
+        # Active alerts of the user, with their crypto loaded.
+        async with self.async_session() as session:
+            query = select(PriceAlert).options(selectinload(PriceAlert.crypto)) \
+                                      .filter(PriceAlert.user_id == user_id, PriceAlert.triggered_at.is_(None)) \
+                                      .order_by(PriceAlert.id)
             result = await session.execute(query)
-            cryptos = result.scalars().all()
+            return result.scalars().all()
 
-            for crypto in cryptos:
-                new_price = data.get(crypto.symbol)
-                if not new_price:
-                    continue
-                new_price = Price(crypto_id=crypto.id, price=new_price)
-                crypto.current_price = new_price
-                session.add(new_price)
-            
+    async def delete_price_alert(self, alert_id: int, user_id: int) -> bool:
+        async with self.async_session() as session:
+            result = await session.execute(delete(PriceAlert).where(PriceAlert.id == alert_id,
+                                                                    PriceAlert.user_id == user_id))
+            await session.commit()
+            return result.rowcount > 0
+
+    async def get_active_price_alerts(self, after_id: Optional[int] = None) -> List[PriceAlert]:
+        async with self.async_session() as session:
+            query = select(PriceAlert).filter(PriceAlert.triggered_at.is_(None)).order_by(PriceAlert.id)
+            if after_id is not None:
+                query = query.filter(PriceAlert.id > after_id)
+            result = await session.execute(query)
+            return result.scalars().all()
+
+    async def get_active_price_alert_ids(self) -> List[int]:
+        async with self.async_session() as session:
+            result = await session.execute(select(PriceAlert.id).filter(PriceAlert.triggered_at.is_(None)))
+            return result.scalars().all()
+
+    async def trigger_price_alerts(self, messages: dict[int, tuple[int, str, str]], timestamp: datetime) -> int:
+        # Marks the alerts (id -> their (chat_id, text, idempotency_key) message) triggered and queues
+        # the messages in the same transaction, so an alert is never triggered without its message.
+        # Alerts deleted in the meantime are left out. Returns the number of messages enqueued.
+        if not messages:
+            return 0
+        async with self.async_session() as session:
+            result = await session.execute(
+                select(PriceAlert.id).where(PriceAlert.id.in_(messages), PriceAlert.triggered_at.is_(None))
+                                     .with_for_update()
+            )
+            active_ids = result.scalars().all()
+            if active_ids:
+                await session.execute(update(PriceAlert).where(PriceAlert.id.in_(active_ids))
+                                                        .values(triggered_at=timestamp))
+            enqueued = await self._add_outbox_messages(session, [messages[alert_id] for alert_id in active_ids], timestamp)
+            await session.commit()
+            return enqueued
+
+    async def acquire_lease(self, name: str, holder: str, ttl: timedelta) -> bool:
+        # Takes the lease if it is free or expired, renews it if `holder` already has it.
+        # The conditional UPDATE (or the primary key on INSERT) makes it safe between processes.
+        now = datetime.now(timezone.utc)
+        async with self.async_session() as session:
+            result = await session.execute(
+                update(Lease).where(Lease.name == name, or_(Lease.holder == holder, Lease.expires_at < now))
+                             .values(holder=holder, expires_at=now + ttl)
+            )
+            if result.rowcount:
+                await session.commit()
+                return True
+            try:
+                await session.execute(insert(Lease).values(name=name, holder=holder, expires_at=now + ttl))
+                await session.commit()
+                return True
+            except IntegrityError:
+                # Someone else holds it.
+                await session.rollback()
+                return False
+
+    async def release_lease(self, name: str, holder: str) -> bool:
+        async with self.async_session() as session:
+            result = await session.execute(delete(Lease).where(Lease.name == name, Lease.holder == holder))
+            await session.commit()
+            return bool(result.rowcount)
+
+    async def enqueue_outbox_messages(self,
+                                      messages: List[tuple[int, str, str]],
+                                      updated_user_ids: Optional[List[int]] = None,
+                                      timestamp: Optional[datetime] = None) -> int:
+        # Stores (chat_id, text, idempotency_key) messages and marks `updated_user_ids` updated
+        # in the same transaction, so a user is rescheduled only once their message is queued.
+        # Messages whose key is already in the outbox are skipped. Returns the number enqueued.
+        timestamp = timestamp or datetime.now(timezone.utc)
+        async with self.async_session() as session:
+            enqueued = await self._add_outbox_messages(session, messages, timestamp)
+            if updated_user_ids:
+                await session.execute(mark_users_updated_query(updated_user_ids, timestamp))
+            await session.commit()
+
+            return enqueued
+
+    async def _add_outbox_messages(self,
+                                   session: AsyncSession,
+                                   messages: List[tuple[int, str, str]],
+                                   timestamp: datetime) -> int:
+        if not messages:
+            return 0
+        keys = [key for _, _, key in messages]
+        result = await session.execute(select(OutboxMessage.idempotency_key)
+                                       .where(OutboxMessage.idempotency_key.in_(keys)))
+        existing_keys = set(result.scalars().all())
+
+        rows = {}
+        for chat_id, text, key in messages:
+            if key not in existing_keys:
+                rows[key] = {'idempotency_key': key, 'chat_id': chat_id, 'text': text,
+                             'status': OutboxStatus.PENDING, 'attempts': 0,
+                             'available_at': timestamp, 'created_at': timestamp}
+        if rows:
+            await session.execute(insert(OutboxMessage), list(rows.values()))
+        return len(rows)
+
+    async def get_pending_outbox_messages(self,
+                                          now: datetime,
+                                          limit: int,
+                                          shard: Optional[tuple[int, int]] = None) -> List[OutboxMessage]:
+        async with self.async_session() as session:
+            query = select(OutboxMessage).where(OutboxMessage.status == OutboxStatus.PENDING,
+                                                OutboxMessage.available_at <= now) \
+                                         .order_by(OutboxMessage.id).limit(limit)
+            if shard is not None:
+                shard_count, shard_index = shard
+                query = query.where(OutboxMessage.chat_id % shard_count == shard_index)
+            result = await session.execute(query)
+            return result.scalars().all()
+
+    async def update_outbox_messages(self, results: List[dict]):
+        # results: {'b_id', 'b_status', 'b_attempts', 'b_available_at', 'b_sent_at'} per delivered message.
+        if not results:
+            return
+        async with self.async_session() as session:
+            outbox_table = OutboxMessage.__table__
+            await session.execute(
+                update(outbox_table).where(outbox_table.c.id == bindparam('b_id'))
+                                    .values(status=bindparam('b_status'),
+                                            attempts=bindparam('b_attempts'),
+                                            available_at=bindparam('b_available_at'),
+                                            sent_at=bindparam('b_sent_at')),
+                results
+            )
+            await session.commit()
+
+    async def delete_outbox_messages(self, before: datetime) -> int:
+        # Finished (not pending) messages created before `before`.
+        async with self.async_session() as session:
+            result = await session.execute(
+                delete(OutboxMessage).where(OutboxMessage.status != OutboxStatus.PENDING,
+                                            OutboxMessage.created_at < before)
+                                     .execution_options(synchronize_session=False)
+            )
             await session.commit()
-            return cryptos
\ No newline at end of file
+            return result.rowcount
@@ -1,9 +1,9 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum, Table, Numeric
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Enum, Table, Numeric, Index, UniqueConstraint
 from sqlalchemy.orm import DeclarativeBase, relationship
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.sql import func
 from datetime import datetime, timezone
-from crypto_track.enums import TimeOptions
+from crypto_track.enums import TimeOptions, Resolution, AlertDirection, OutboxStatus
 
 class Base(AsyncAttrs, DeclarativeBase):
     pass
@@ -11,7 +11,9 @@ class Base(AsyncAttrs, DeclarativeBase):
 # Association Table for the many-to-many relationship between User and Crypto
 user_crypto_association = Table('user_crypto', Base.metadata,
     Column('user_id', ForeignKey('users.id'), primary_key=True),
-    Column('crypto_id', ForeignKey('cryptos.id'), primary_key=True)
+    Column('crypto_id', ForeignKey('cryptos.id'), primary_key=True),
+    # The primary key covers lookups by user, this one covers lookups by crypto.
+    Index('ix_user_crypto_crypto_id', 'crypto_id')
 )
 
 class User(Base):
@@ -25,6 +27,9 @@ class User(Base):
         back_populates="tracked_by_users")
     how_often = Column(Enum(TimeOptions))
     last_update = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    # When the user should receive the next price update, kept in sync with last_update and how_often.
+    next_due_at = Column(DateTime(timezone=True), index=True)
+    price_alerts = relationship("PriceAlert", cascade="all, delete-orphan")
 
     def __repr__(self) -> str:
         return f'User(id={self.id}, name={self.name}, joined_date={self.joined_date}, how_often={self.how_often.value})'
@@ -34,6 +39,9 @@ class Crypto(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(50))
     symbol = Column(String(10), unique=True)
+    # Copy of the newest Price row, written together with it so reads don't have to scan prices.
+    last_price = Column(Numeric(precision=10, scale=2))
+    last_price_at = Column(DateTime(timezone=True))
     prices = relationship("Price", back_populates="crypto")
     tracked_by_users = relationship(
         "User",
@@ -41,7 +49,7 @@ class Crypto(Base):
         back_populates="tracking_cryptos")
     
     def __repr__(self) -> str:
-        return f"Crypto(id={self.id}, name='{self.name}', symbol='{self.symbol}', current_price='[dynamic]')"
+        return f"Crypto(id={self.id}, name='{self.name}', symbol='{self.symbol}', last_price={self.last_price})"
 
 class Price(Base):
     __tablename__ = "prices"
@@ -54,3 +62,115 @@ class Price(Base):
 
     def __repr__(self) -> str:
             return f"Price(id={self.id}, crypto_id={self.crypto_id}, price={self.price}, date='{self.date.isoformat()}')"
+
+# Latest price, price history and delete queries all filter by crypto and sort by date.
+Index('ix_prices_crypto_id_date', Price.crypto_id, Price.date.desc())
+# Retention scans old prices of every crypto by date.
+Index('ix_prices_date', Price.date)
+
+
+class PriceRollup(Base):
+    # OHLC candle of one crypto in one hour or day. Every stored price is folded into the candles of
+    # its hour and day, older prices through the backfill (see BackfillCursor).
+    __tablename__ = "price_rollups"
+    id = Column(Integer, primary_key=True)
+    crypto_id = Column(Integer, ForeignKey('cryptos.id'))
+    resolution = Column(Enum(Resolution))
+    bucket_start = Column(DateTime(timezone=True))
+    open = Column(Numeric(precision=10, scale=2))
+    high = Column(Numeric(precision=10, scale=2))
+    low = Column(Numeric(precision=10, scale=2))
+    close = Column(Numeric(precision=10, scale=2))
+    count = Column(Integer)
+
+    __table_args__ = (
+        UniqueConstraint('crypto_id', 'resolution', 'bucket_start', name='uq_price_rollups_bucket'),
+        Index('ix_price_rollups_resolution_bucket_start', 'resolution', 'bucket_start'),
+    )
+
+    def __repr__(self) -> str:
+        return (f"PriceRollup(crypto_id={self.crypto_id}, resolution={self.resolution.value}, "
+                f"bucket_start='{self.bucket_start.isoformat()}', open={self.open}, high={self.high}, "
+                f"low={self.low}, close={self.close}, count={self.count})")
+
+
+class PriceAlert(Base):
+    # Sent once to the user when the crypto price goes above/below threshold, then marked triggered.
+    __tablename__ = "price_alerts"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
+    crypto_id = Column(Integer, ForeignKey('cryptos.id'))
+    direction = Column(Enum(AlertDirection))
+    threshold = Column(Numeric(precision=10, scale=2))
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    triggered_at = Column(DateTime(timezone=True))
+    crypto = relationship("Crypto")
+
+    def __repr__(self) -> str:
+        return (f"PriceAlert(id={self.id}, user_id={self.user_id}, crypto_id={self.crypto_id}, "
+                f"direction={self.direction.value}, threshold={self.threshold}, triggered_at={self.triggered_at})")
+
+
+class OutboxMessage(Base):
+    # Rendered messages waiting to be sent by the outbox worker. The idempotency key makes
+    # enqueueing the same message twice (e.g. a retried tick) a no-op.
+    __tablename__ = "outbox_messages"
+    id = Column(Integer, primary_key=True)
+    idempotency_key = Column(String(100), unique=True)
+    chat_id = Column(Integer)
+    text = Column(Text)
+    status = Column(Enum(OutboxStatus), default=OutboxStatus.PENDING)
+    attempts = Column(Integer, default=0)
+    # Pending messages are not sent before this, pushed back after every failed attempt.
+    available_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    sent_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        Index('ix_outbox_messages_status_available_at', 'status', 'available_at'),
+    )
+
+    def __repr__(self) -> str:
+        return (f"OutboxMessage(id={self.id}, idempotency_key={self.idempotency_key}, chat_id={self.chat_id}, "
+                f"status={self.status.value}, attempts={self.attempts})")
+
+
+class FSMRecord(Base):
+    # aiogram FSM state and data of one storage key, see crypto_track.fsm_storage.
+    __tablename__ = "fsm_states"
+    key = Column(String(200), primary_key=True)
+    state = Column(String(100))
+    data = Column(Text)
+    expires_at = Column(DateTime(timezone=True), index=True)
+
+    def __repr__(self) -> str:
+        return f"FSMRecord(key={self.key}, state={self.state}, expires_at={self.expires_at})"
+
+
+class SchemaVersion(Base):
+    # Migrations from crypto_track.database.run that were applied to this database.
+    __tablename__ = "schema_version"
+    version = Column(Integer, primary_key=True)
+    applied_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+
+class Lease(Base):
+    # Named leases, held by one bot process at a time until expires_at.
+    __tablename__ = "leases"
+    name = Column(String(50), primary_key=True)
+    holder = Column(String(100))
+    expires_at = Column(DateTime(timezone=True))
+
+    def __repr__(self) -> str:
+        return f"Lease(name={self.name}, holder={self.holder}, expires_at={self.expires_at})"
+
+
+class BackfillCursor(Base):
+    # Progress of a backfill over [position, end_at), position moves forward one batch per transaction.
+    __tablename__ = "backfill_cursors"
+    name = Column(String(50), primary_key=True)
+    position = Column(DateTime(timezone=True))
+    end_at = Column(DateTime(timezone=True))
+
+    def __repr__(self) -> str:
+        return f"BackfillCursor(name={self.name}, position={self.position}, end_at={self.end_at})"
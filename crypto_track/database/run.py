@@ -1,13 +1,116 @@
+from datetime import datetime, timezone
+from sqlalchemy import Connection, Table, Column, inspect, select, update, insert, func, bindparam, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
-from crypto_track.database.models import Base
+from crypto_track.database.models import (Base, User, Crypto, Price, PriceRollup, BackfillCursor, SchemaVersion,
+                                          user_crypto_association)
+from crypto_track.database.manager import calculate_next_due_at, calculate_bucket_start, CANDLES_BACKFILL
+from crypto_track.enums import Resolution
 
-async def init_db(database_url: str) -> AsyncEngine:
+async def init_db(database_url: str, echo: bool = True) -> AsyncEngine:
     engine = create_async_engine(
         database_url,
-        echo=True,
+        echo=echo,
     )
 
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
-    return engine
\ No newline at end of file
+    await run_migrations(engine)
+
+    return engine
+
+
+# Migrations bring databases created by older versions up to date with the models.
+# create_all already creates everything for new databases, so every step has to be
+# safe to run against a schema that is already up to date.
+
+def add_column(conn: Connection, table: Table, column: Column):
+    existing_columns = {column['name'] for column in inspect(conn).get_columns(table.name)}
+    if column.name in existing_columns:
+        return
+    column_type = column.type.compile(dialect=conn.dialect)
+    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+
+def create_indexes(conn: Connection, table: Table):
+    for index in table.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def migration_1_indexes(conn: Connection):
+    create_indexes(conn, Price.__table__)
+    create_indexes(conn, user_crypto_association)
+
+
+def migration_2_users_next_due_at(conn: Connection):
+    users = User.__table__
+    add_column(conn, users, users.c.next_due_at)
+    create_indexes(conn, users)
+
+    rows = conn.execute(
+        select(users.c.id, users.c.last_update, users.c.how_often).where(users.c.next_due_at.is_(None))
+    ).all()
+    schedules = [{'user_id': row.id, 'next_due_at': calculate_next_due_at(row.last_update, row.how_often)}
+                 for row in rows if row.last_update and row.how_often]
+    if schedules:
+        conn.execute(
+            update(users).where(users.c.id == bindparam('user_id')).values(next_due_at=bindparam('next_due_at')),
+            schedules
+        )
+
+
+def migration_3_cryptos_last_price(conn: Connection):
+    cryptos, prices = Crypto.__table__, Price.__table__
+    add_column(conn, cryptos, cryptos.c.last_price)
+    add_column(conn, cryptos, cryptos.c.last_price_at)
+
+    latest_price = select(prices.c.price).where(prices.c.crypto_id == cryptos.c.id) \
+                                         .order_by(prices.c.date.desc()).limit(1).scalar_subquery()
+    latest_date = select(func.max(prices.c.date)).where(prices.c.crypto_id == cryptos.c.id).scalar_subquery()
+    conn.execute(
+        update(cryptos).where(cryptos.c.last_price.is_(None)).values(last_price=latest_price, last_price_at=latest_date)
+    )
+
+
+def migration_4_prices_date_index(conn: Connection):
+    # The price_rollups table itself is created by create_all.
+    create_indexes(conn, Price.__table__)
+
+
+def migration_5_candles_backfill(conn: Connection):
+    # From now on every stored price is folded into its candles right away. The prices stored before,
+    # and the hourly rollups older versions compacted them into, are folded by the candle backfill.
+    cursors, prices, rollups = BackfillCursor.__table__, Price.__table__, PriceRollup.__table__
+    if conn.execute(select(cursors.c.name).where(cursors.c.name == CANDLES_BACKFILL)).first():
+        return
+    now = datetime.now(timezone.utc)
+    oldest_price = conn.execute(select(func.min(prices.c.date))).scalar()
+    oldest_rollup = conn.execute(
+        select(func.min(rollups.c.bucket_start)).where(rollups.c.resolution == Resolution.HOUR)
+    ).scalar()
+    position = min([calculate_bucket_start(date, Resolution.DAY) for date in (oldest_price, oldest_rollup) if date],
+                   default=now)
+    conn.execute(insert(cursors).values(name=CANDLES_BACKFILL, position=min(position, now), end_at=now))
+
+
+MIGRATIONS = [
+    (1, migration_1_indexes),
+    (2, migration_2_users_next_due_at),
+    (3, migration_3_cryptos_last_price),
+    (4, migration_4_prices_date_index),
+    (5, migration_5_candles_backfill),
+]
+
+
+async def run_migrations(engine: AsyncEngine):
+    async with engine.connect() as conn:
+        current_version = (await conn.execute(select(func.max(SchemaVersion.version)))).scalar() or 0
+
+    for version, migration in MIGRATIONS:
+        if version <= current_version:
+            continue
+        # One transaction per migration, so a failure leaves the earlier ones recorded.
+        async with engine.begin() as conn:
+            await conn.run_sync(migration)
+            await conn.execute(SchemaVersion.__table__.insert().values(version=version))
+        print(f'Applied database migration {version} ({migration.__name__}).')
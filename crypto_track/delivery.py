@@ -0,0 +1,155 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable, Optional, Tuple
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from crypto_track.enums import DeliveryStatus
+
+# Telegram allows about 30 messages per second in total and one message per second per chat.
+GLOBAL_MESSAGES_PER_SECOND = 30
+CHAT_MESSAGES_PER_SECOND = 1
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        # Used when Telegram answers with "retry after", nobody may send until it has passed.
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+@dataclass
+class DeliveryStats:
+    sent: int = 0
+    blocked: int = 0
+    failed: int = 0
+    retried: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def total(self) -> int:
+        return self.sent + self.blocked + self.failed
+
+    @property
+    def messages_per_second(self) -> float:
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self) -> str:
+        return (f'DeliveryStats(total={self.total}, sent={self.sent}, blocked={self.blocked}, '
+                f'failed={self.failed}, retried={self.retried}, elapsed={self.elapsed:.2f}s, '
+                f'rate={self.messages_per_second:.2f} msg/s)')
+
+
+OnResult = Callable[[Any, DeliveryStatus], Awaitable[None]]
+
+
+class DeliveryEngine:
+    def __init__(self,
+                 bot: Bot,
+                 concurrency: int = 20,
+                 global_rate: float = GLOBAL_MESSAGES_PER_SECOND,
+                 chat_rate: float = CHAT_MESSAGES_PER_SECOND,
+                 max_retries: int = 3):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.chat_interval = 1 / chat_rate
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(rate=global_rate, capacity=global_rate)
+        self._chats_last_sent: dict[int, float] = {}
+
+    async def deliver(self,
+                      messages: Iterable[Tuple[int, str]] | AsyncIterable[Tuple[int, str]],
+                      on_result: Optional[OnResult] = None) -> DeliveryStats:
+        # Sends (chat_id, text) pairs with at most `concurrency` requests in flight.
+        # A message may carry a key as third item, on_result then gets it instead of the chat id.
+        stats = DeliveryStats()
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        started_at = time.monotonic()
+
+        workers = [asyncio.create_task(self._worker(queue, stats, on_result)) for _ in range(self.concurrency)]
+        try:
+            if isinstance(messages, AsyncIterable):
+                async for message in messages:
+                    await queue.put(message)
+            else:
+                for message in messages:
+                    await queue.put(message)
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        stats.elapsed = time.monotonic() - started_at
+        self._forget_idle_chats()
+        return stats
+
+    async def _worker(self, queue: asyncio.Queue, stats: DeliveryStats, on_result: Optional[OnResult]):
+        while True:
+            chat_id, text, *key = await queue.get()
+            try:
+                status = await self._send(chat_id, text, stats)
+                if on_result:
+                    await on_result(key[0] if key else chat_id, status)
+            except Exception as ex:
+                print(f'Something went wrong while handling delivery to user [{chat_id}].\nDetail: {ex}.')
+            finally:
+                queue.task_done()
+
+    async def _send(self, chat_id: int, text: str, stats: DeliveryStats) -> DeliveryStatus:
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_chat(chat_id)
+            await self.global_bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text)
+                stats.sent += 1
+                return DeliveryStatus.SENT
+            except TelegramRetryAfter as ex:
+                self.global_bucket.pause(ex.retry_after)
+                if attempt < self.max_retries:
+                    stats.retried += 1
+            except TelegramForbiddenError:
+                print(f'User [{chat_id}] has blocked the bot.')
+                stats.blocked += 1
+                return DeliveryStatus.BLOCKED
+            except Exception as ex:
+                print(f'Something went wrong while sending update to user [{chat_id}].\nDetail: {ex}.')
+                break
+
+        stats.failed += 1
+        return DeliveryStatus.FAILED
+
+    async def _wait_for_chat(self, chat_id: int):
+        now = time.monotonic()
+        send_at = max(now, self._chats_last_sent.get(chat_id, 0.0) + self.chat_interval)
+        self._chats_last_sent[chat_id] = send_at
+        if send_at > now:
+            await asyncio.sleep(send_at - now)
+
+    def _forget_idle_chats(self):
+        now = time.monotonic()
+        self._chats_last_sent = {chat_id: sent_at for chat_id, sent_at in self._chats_last_sent.items()
+                                 if now - sent_at < self.chat_interval}
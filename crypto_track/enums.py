@@ -7,3 +7,26 @@ class TimeOptions(Enum):
     FORTY_FIVE = '45'
     SIXTY = '60'
     ONE_TWENTY = '120'
+
+
+class DeliveryStatus(Enum):
+    SENT = 'sent'
+    BLOCKED = 'blocked'
+    FAILED = 'failed'
+
+
+class OutboxStatus(Enum):
+    PENDING = 'pending'
+    SENT = 'sent'
+    BLOCKED = 'blocked'
+    FAILED = 'failed'
+
+
+class Resolution(Enum):
+    HOUR = 'hour'
+    DAY = 'day'
+
+
+class AlertDirection(Enum):
+    ABOVE = 'above'
+    BELOW = 'below'
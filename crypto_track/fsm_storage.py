@@ -0,0 +1,148 @@
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import select, update, insert, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from crypto_track.database.manager import AsyncDatabaseManager
+from crypto_track.database.models import FSMRecord
+
+
+class SQLAlchemyStorage(BaseStorage):
+    # Keeps FSM states and data in the fsm_states table, so flows survive restarts and are shared
+    # between processes. Flows expire `ttl` after their last change.
+    # Every change is one transaction that reads the row and writes it back with the row locked, so
+    # updates of the same flow from other workers are never overwritten. toggle_data_item is the
+    # read-modify-write of a checkbox tap.
+
+    def __init__(self,
+                 async_session: Optional[async_sessionmaker] = None,
+                 ttl: timedelta = timedelta(days=1),
+                 engine: Optional[AsyncEngine] = None):
+        # Without a session maker the database of AsyncDatabaseManager is used.
+        self._async_session = async_session
+        self.ttl = ttl
+        # Set when the storage owns its engine, e.g. a separate SQLite file.
+        self._engine = engine
+        self._table_ready = engine is None
+
+    @classmethod
+    def from_url(cls, database_url: str, ttl: timedelta = timedelta(days=1)) -> 'SQLAlchemyStorage':
+        engine = create_async_engine(database_url)
+        return cls(async_session=async_sessionmaker(engine, expire_on_commit=False), ttl=ttl, engine=engine)
+
+    @property
+    def async_session(self) -> async_sessionmaker:
+        return self._async_session or AsyncDatabaseManager().async_session
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        def set_record_state(record: dict):
+            record['state'] = state.state if isinstance(state, State) else state
+        await self._modify(key, set_record_state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(key))['state']
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        def set_record_data(record: dict):
+            record['data'] = data.copy()
+        await self._modify(key, set_record_data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._load(key))['data']
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        def update_record_data(record: dict):
+            record['data'] = {**record['data'], **data}
+        return (await self._modify(key, update_record_data))['data'].copy()
+
+    async def toggle_data_item(self, key: StorageKey, field: str, item: Any) -> Dict[str, Any]:
+        # Adds `item` to the sorted list in data[field], or removes it when it is there already.
+        # Returns the updated data.
+        def toggle_record_item(record: dict):
+            items = set(record['data'].get(field, []))
+            items.symmetric_difference_update({item})
+            record['data'] = {**record['data'], field: sorted(items)}
+        return (await self._modify(key, toggle_record_item))['data'].copy()
+
+    async def delete_expired(self) -> int:
+        await self._ensure_table()
+        async with self.async_session() as session:
+            result = await session.execute(
+                delete(FSMRecord).where(FSMRecord.expires_at < datetime.now(timezone.utc))
+                                 .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+            return result.rowcount
+
+    async def close(self) -> None:
+        if self._engine is not None:
+            await self._engine.dispose()
+
+    async def _load(self, key: StorageKey) -> dict:
+        await self._ensure_table()
+        async with self.async_session() as session:
+            return await self._select(session, build_record_key(key))
+
+    async def _select(self, session: AsyncSession, record_key: str) -> dict:
+        result = await session.execute(
+            select(FSMRecord.state, FSMRecord.data).where(FSMRecord.key == record_key,
+                                                          FSMRecord.expires_at >= datetime.now(timezone.utc))
+        )
+        row = result.first()
+        return {'state': row.state, 'data': json.loads(row.data or '{}')} if row else {'state': None, 'data': {}}
+
+    async def _modify(self, key: StorageKey, modify: Callable[[dict], None]) -> dict:
+        # Reads the record, applies `modify` to it and writes it back, in one transaction.
+        record_key = build_record_key(key)
+        await self._ensure_table()
+        async with self.async_session() as session:
+            # A write before the read locks the row (the database on SQLite) until the commit.
+            await session.execute(update(FSMRecord).where(FSMRecord.key == record_key)
+                                                   .values(expires_at=FSMRecord.expires_at))
+            record = await self._select(session, record_key)
+            modify(record)
+            if record['state'] is None and not record['data']:
+                # Cleared flows don't need a row.
+                await session.execute(delete(FSMRecord).where(FSMRecord.key == record_key))
+                await session.commit()
+                return record
+
+            values = {'state': record['state'],
+                      'data': json.dumps(record['data']),
+                      'expires_at': datetime.now(timezone.utc) + self.ttl}
+            result = await session.execute(update(FSMRecord).where(FSMRecord.key == record_key).values(**values))
+            if not result.rowcount:
+                try:
+                    await session.execute(insert(FSMRecord).values(key=record_key, **values))
+                except IntegrityError:
+                    # Inserted by a concurrent update of the same key in the meantime, apply it on top.
+                    await session.rollback()
+                    return await self._modify(key, modify)
+            await session.commit()
+            return record
+
+    async def _ensure_table(self):
+        if self._table_ready:
+            return
+        async with self._engine.begin() as conn:
+            await conn.run_sync(FSMRecord.__table__.create, checkfirst=True)
+        self._table_ready = True
+
+
+async def toggle_data_item(state: FSMContext, field: str, item: Any) -> Dict[str, Any]:
+    # toggle_data_item of the storage in one read-modify-write, or the same with get_data and
+    # update_data for storages without it (MemoryStorage never awaits in between).
+    if isinstance(state.storage, SQLAlchemyStorage):
+        return await state.storage.toggle_data_item(key=state.key, field=field, item=item)
+    data = await state.get_data()
+    items = set(data.get(field, []))
+    items.symmetric_difference_update({item})
+    return await state.update_data({field: sorted(items)})
+
+
+def build_record_key(key: StorageKey) -> str:
+    return f'{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ""}:{key.destiny}'
@@ -0,0 +1,149 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+import numpy as np
+from crypto_track.database.manager import AsyncDatabaseManager
+from crypto_track.enums import Resolution
+
+# Window: (length, where its prices come from). Longer windows read the close prices of the candles.
+HISTORY_WINDOWS = {
+    '24h': (timedelta(hours=24), None),
+    '7d': (timedelta(days=7), Resolution.HOUR),
+    '30d': (timedelta(days=30), Resolution.HOUR),
+    '1y': (timedelta(days=365), Resolution.DAY),
+}
+MOVING_AVERAGE_POINTS = 20
+
+_MISSING = object()
+
+
+@dataclass
+class PriceSeries:
+    dates: np.ndarray   # datetime64[s], UTC
+    prices: np.ndarray  # float64
+
+
+@dataclass
+class PriceStats:
+    crypto_id: int
+    window: str
+    points: int
+    first: float
+    last: float
+    change_percent: float
+    low: float
+    high: float
+    # Mean of the last MOVING_AVERAGE_POINTS prices.
+    moving_average: float
+    # Standard deviation of the log returns between consecutive prices, in percent.
+    volatility_percent: float
+
+
+def to_naive_utc(date: datetime) -> datetime:
+    # numpy's datetime64 has no timezone, SQLite gives naive UTC dates and Postgres aware ones.
+    return date.astimezone(timezone.utc).replace(tzinfo=None) if date.tzinfo else date
+
+
+async def load_price_series(crypto_ids: Iterable[int],
+                            start: datetime,
+                            end: datetime,
+                            resolution: Optional[Resolution] = None) -> dict[int, PriceSeries]:
+    # Streams the (crypto, date, price) rows of the range into numpy arrays, chunk by chunk.
+    ids_chunks, dates_chunks, prices_chunks = [], [], []
+    async for rows in AsyncDatabaseManager().stream_price_history(crypto_ids=list(crypto_ids),
+                                                                  start=start,
+                                                                  end=end,
+                                                                  resolution=resolution):
+        ids_chunks.append(np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)))
+        dates_chunks.append(np.array([to_naive_utc(row[1]) for row in rows], dtype='datetime64[s]'))
+        prices_chunks.append(np.fromiter((float(row[2]) for row in rows), dtype=np.float64, count=len(rows)))
+    if not ids_chunks:
+        return {}
+
+    ids = np.concatenate(ids_chunks)
+    dates = np.concatenate(dates_chunks)
+    prices = np.concatenate(prices_chunks)
+    # Rows are ordered by crypto, so every crypto is one contiguous slice of the arrays.
+    crypto_ids, starts = np.unique(ids, return_index=True)
+    ends = np.append(starts[1:], len(ids))
+    return {int(crypto_id): PriceSeries(dates=dates[start:end], prices=prices[start:end])
+            for crypto_id, start, end in zip(crypto_ids, starts, ends)}
+
+
+def moving_average(prices: np.ndarray, points: int) -> np.ndarray:
+    # Simple moving average over `points` consecutive prices, from a cumulative sum.
+    points = max(1, min(points, len(prices)))
+    cumulative = np.cumsum(np.insert(prices, 0, 0.0))
+    return (cumulative[points:] - cumulative[:-points]) / points
+
+
+def compute_price_stats(crypto_id: int, window: str, prices: np.ndarray) -> Optional[PriceStats]:
+    if not len(prices):
+        return None
+    first, last = float(prices[0]), float(prices[-1])
+    positive_prices = prices[prices > 0]
+    log_returns = np.diff(np.log(positive_prices))
+    return PriceStats(crypto_id=crypto_id,
+                      window=window,
+                      points=len(prices),
+                      first=first,
+                      last=last,
+                      change_percent=(last / first - 1) * 100 if first else 0.0,
+                      low=float(prices.min()),
+                      high=float(prices.max()),
+                      moving_average=float(moving_average(prices, MOVING_AVERAGE_POINTS)[-1]),
+                      volatility_percent=float(log_returns.std() * 100) if len(log_returns) else 0.0)
+
+
+class PriceHistoryService:
+    # Price statistics per (crypto, window), computed from one streamed query for all the requested
+    # cryptos and kept in an LRU cache for max_age.
+
+    def __init__(self, max_entries: int = 1024, max_age: timedelta = timedelta(minutes=5)):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._cache: OrderedDict[tuple[int, str], tuple[datetime, Optional[PriceStats]]] = OrderedDict()
+
+    async def get_stats(self, crypto_id: int, window: str) -> Optional[PriceStats]:
+        return (await self.get_many_stats([crypto_id], window)).get(crypto_id)
+
+    async def get_many_stats(self, crypto_ids: Iterable[int], window: str) -> dict[int, PriceStats]:
+        now = datetime.now(timezone.utc)
+        stats, missing_ids = {}, []
+        for crypto_id in crypto_ids:
+            cached = self._get_cached((crypto_id, window), now)
+            if cached is _MISSING:
+                missing_ids.append(crypto_id)
+            elif cached is not None:
+                stats[crypto_id] = cached
+
+        if missing_ids:
+            length, resolution = HISTORY_WINDOWS[window]
+            series = await load_price_series(missing_ids, start=now - length, end=now, resolution=resolution)
+            for crypto_id in missing_ids:
+                crypto_series = series.get(crypto_id)
+                crypto_stats = compute_price_stats(crypto_id, window, crypto_series.prices) if crypto_series else None
+                self._put((crypto_id, window), now, crypto_stats)
+                if crypto_stats:
+                    stats[crypto_id] = crypto_stats
+        return stats
+
+    def clear(self):
+        self._cache.clear()
+
+    def _get_cached(self, key: tuple[int, str], now: datetime):
+        entry = self._cache.get(key)
+        if entry is None or now - entry[0] > self.max_age:
+            return _MISSING
+        self._cache.move_to_end(key)
+        return entry[1]
+
+    def _put(self, key: tuple[int, str], now: datetime, stats: Optional[PriceStats]):
+        self._cache[key] = (now, stats)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+
+history_service = PriceHistoryService()
@@ -0,0 +1,182 @@
+import functools
+import inspect
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+from aiohttp import web
+from aiogram import BaseMiddleware, Router
+from aiogram.types import TelegramObject
+
+# Metrics in the Prometheus text format, kept in process memory and served on /metrics.
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Metric:
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: dict[tuple, Any] = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def _format_labels(self, key: tuple, extra: Optional[dict] = None) -> str:
+        pairs = list(zip(self.label_names, key)) + list((extra or {}).items())
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+    def render(self) -> list[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}'] + self._render_samples()
+
+    def _render_samples(self) -> list[str]:
+        return [f'{self.name}{self._format_labels(key)} {value}' for key, value in self._values.items()]
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        values = self._values.get(key)
+        if values is None:
+            # Per bucket counts (not cumulative, the last one is +Inf), sum and count.
+            values = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        values[0][bisect_left(self.buckets, value)] += 1
+        values[1] += value
+        values[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def _render_samples(self) -> list[str]:
+        lines = []
+        for key, (bucket_counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{self._format_labels(key, {"le": bound})} {cumulative}')
+            lines.append(f'{self.name}_sum{self._format_labels(key)} {total}')
+            lines.append(f'{self.name}_count{self._format_labels(key)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(line for metric in self._metrics.values() for line in metric.render()) + '\n'
+
+
+registry = MetricsRegistry()
+
+TICK_SECONDS = registry.register(Histogram(
+    'crypto_track_tick_seconds', 'Time spent in the phases of the price update tick.', ['phase']))
+API_CHUNK_SECONDS = registry.register(Histogram(
+    'crypto_track_api_chunk_seconds', 'Latency of pricemulti requests, one per chunk of symbols.', ['status']))
+USERS_DUE = registry.register(Counter(
+    'crypto_track_users_due_total', 'Users whose price update was enqueued.'))
+MESSAGES = registry.register(Counter(
+    'crypto_track_messages_total', 'Outbox messages by delivery result.', ['status']))
+OUTBOX_BATCH_SECONDS = registry.register(Histogram(
+    'crypto_track_outbox_batch_seconds', 'Time spent sending one batch of outbox messages.'))
+DB_QUERY_SECONDS = registry.register(Histogram(
+    'crypto_track_db_query_seconds', 'Time spent in AsyncDatabaseManager methods.', ['method']))
+HANDLER_SECONDS = registry.register(Histogram(
+    'crypto_track_handler_seconds', 'Latency of the bot handlers per router.', ['router', 'event']))
+HANDLER_ERRORS = registry.register(Counter(
+    'crypto_track_handler_errors_total', 'Exceptions raised by the bot handlers per router.', ['router', 'event']))
+CHARTS = registry.register(Counter(
+    'crypto_track_charts_total', 'Chart requests by result: rendered, cached (file_id reused) or no_data.', ['result']))
+CHART_RENDER_SECONDS = registry.register(Histogram(
+    'crypto_track_chart_render_seconds', 'Time spent rendering a chart in the process pool.'))
+
+
+def time_methods(histogram: Histogram):
+    # Class decorator, times every public coroutine method with the method name as label.
+    def decorate(cls):
+        for name, method in list(vars(cls).items()):
+            if not name.startswith('_') and inspect.iscoroutinefunction(method):
+                setattr(cls, name, timed(histogram, method))
+        return cls
+    return decorate
+
+
+def timed(histogram: Histogram, method: Callable[..., Awaitable]):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        with histogram.time(method=method.__name__):
+            return await method(*args, **kwargs)
+    return wrapper
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    # Registered as inner middleware, so it only sees events a handler of the router matched.
+    def __init__(self, router_name: str, event_name: str):
+        self.router_name = router_name
+        self.event_name = event_name
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        started_at = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(router=self.router_name, event=self.event_name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started_at, router=self.router_name, event=self.event_name)
+
+
+def instrument_router(router: Router, router_name: str):
+    router.message.middleware(HandlerMetricsMiddleware(router_name, 'message'))
+    router.callback_query.middleware(HandlerMetricsMiddleware(router_name, 'callback_query'))
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    return runner
@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from crypto_track.bot import bot
+from crypto_track.coordination import NodeCoordinator
+from crypto_track.database.manager import AsyncDatabaseManager
+from crypto_track.database.models import OutboxMessage
+from crypto_track.delivery import DeliveryEngine
+from crypto_track.enums import DeliveryStatus, OutboxStatus
+from crypto_track.metrics import MESSAGES, OUTBOX_BATCH_SECONDS
+
+OUTBOX_STATUSES = {
+    DeliveryStatus.SENT: OutboxStatus.SENT,
+    DeliveryStatus.BLOCKED: OutboxStatus.BLOCKED,
+}
+
+
+class OutboxWorker:
+    # Drains the outbox_messages table: sends pending messages a batch at a time and stores
+    # every result, so a crash only resends the batch that was in flight.
+    # Failed messages are retried after base_backoff * 2 ** attempts, up to max_attempts times.
+    # Every node drains the messages of its own shard of chats (chat id % node count).
+
+    def __init__(self,
+                 delivery_engine: Optional[DeliveryEngine] = None,
+                 batch_size: int = 200,
+                 poll_interval: float = 2,
+                 max_attempts: int = 5,
+                 base_backoff: timedelta = timedelta(seconds=30)):
+        self.delivery_engine = delivery_engine or DeliveryEngine(bot)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self._running = False
+
+    async def run(self):
+        self._running = True
+        while self._running:
+            try:
+                delivered = await self.drain_batch()
+            except Exception as ex:
+                print(f'\u001b[31mException happend while draining the outbox.\nDetail:{ex}\u001b[37m')
+                delivered = 0
+            # A full batch means there is probably more waiting.
+            if delivered < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    def stop(self):
+        self._running = False
+
+    async def drain_batch(self) -> int:
+        messages = await AsyncDatabaseManager().get_pending_outbox_messages(now=datetime.now(timezone.utc),
+                                                                            limit=self.batch_size,
+                                                                            shard=NodeCoordinator().shard)
+        if not messages:
+            return 0
+
+        statuses: dict[int, DeliveryStatus] = {}
+
+        async def on_result(message_id: int, status: DeliveryStatus):
+            statuses[message_id] = status
+
+        with OUTBOX_BATCH_SECONDS.time():
+            stats = await self.delivery_engine.deliver([(message.chat_id, message.text, message.id) for message in messages],
+                                                       on_result=on_result)
+        await AsyncDatabaseManager().update_outbox_messages(self.build_results(messages, statuses))
+        MESSAGES.inc(stats.sent, status='sent')
+        MESSAGES.inc(stats.blocked, status='blocked')
+        MESSAGES.inc(stats.failed, status='failed')
+        print(f'Outbox batch delivered. {stats}')
+        return len(messages)
+
+    def build_results(self, messages: List[OutboxMessage], statuses: dict[int, DeliveryStatus]) -> List[dict]:
+        now = datetime.now(timezone.utc)
+        results = []
+        for message in messages:
+            # Messages without a result failed in the delivery engine itself.
+            status = statuses.get(message.id, DeliveryStatus.FAILED)
+            attempts = message.attempts + 1
+            if status in OUTBOX_STATUSES:
+                outbox_status, available_at = OUTBOX_STATUSES[status], message.available_at
+            elif attempts < self.max_attempts:
+                outbox_status, available_at = OutboxStatus.PENDING, now + self.base_backoff * 2 ** (attempts - 1)
+            else:
+                outbox_status, available_at = OutboxStatus.FAILED, message.available_at
+            results.append({'b_id': message.id,
+                            'b_status': outbox_status,
+                            'b_attempts': attempts,
+                            'b_available_at': available_at,
+                            'b_sent_at': now if outbox_status == OutboxStatus.SENT else None})
+        return results
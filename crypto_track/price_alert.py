@@ -0,0 +1,181 @@
+from typing import List
+from aiogram import Router, F
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import (Message,
+                           ReplyKeyboardRemove,
+                           InlineKeyboardMarkup,
+                           InlineKeyboardButton,
+                           CallbackQuery,
+                           ReplyKeyboardMarkup,
+                           KeyboardButton)
+from crypto_track.alert_index import ALERT_DIRECTION_TEXT
+from crypto_track.catalog import crypto_catalog
+from crypto_track.database.manager import AsyncDatabaseManager
+from crypto_track.database.models import PriceAlert
+from crypto_track.enums import AlertDirection
+from crypto_track.price_cache import get_latest_prices
+from crypto_track.uils import generate_main_keyboard
+
+
+def load_price_alert_messages():
+    with open('messages/crypto_price/account_not_exists.txt', 'r', encoding='utf-8') as file:
+        account_not_exists_text = file.read()
+
+    with open('messages/alerts/your_alerts.txt', 'r', encoding='utf-8') as file:
+        your_alerts_text = file.read()
+
+    with open('messages/alerts/ask_symbol.txt', 'r', encoding='utf-8') as file:
+        ask_symbol_text = file.read()
+
+    with open('messages/alerts/ask_direction.txt', 'r', encoding='utf-8') as file:
+        ask_direction_text = file.read()
+
+    with open('messages/alerts/ask_threshold.txt', 'r', encoding='utf-8') as file:
+        ask_threshold_text = file.read()
+
+    with open('messages/alerts/alert_created.txt', 'r', encoding='utf-8') as file:
+        alert_created_text = file.read()
+
+    return account_not_exists_text, your_alerts_text, ask_symbol_text, ask_direction_text, ask_threshold_text, alert_created_text
+account_not_exists_text, your_alerts_text, ask_symbol_text, ask_direction_text, ask_threshold_text, alert_created_text = load_price_alert_messages()
+
+MAX_ALERTS_PER_USER = 10
+# Thresholds are stored as Numeric(10, 2).
+MAX_THRESHOLD = 10 ** 8
+
+DIRECTION_BUTTONS = {
+    AlertDirection.ABOVE: '📈 بالاتر از',
+    AlertDirection.BELOW: '📉 پایین تر از',
+}
+
+
+class AlertForm(StatesGroup):
+    crypto = State()
+    direction = State()
+    threshold = State()
+
+price_alert_router = Router()
+
+
+@price_alert_router.message(F.text == 'هشدار قیمت 🔔')
+async def view_price_alerts(message: Message, state: FSMContext):
+    await state.clear()
+    user = await AsyncDatabaseManager().check_user_exists(user_id=message.from_user.id)
+    if not user:
+        await message.reply(account_not_exists_text, reply_markup=ReplyKeyboardRemove())
+        return
+
+    alerts = await AsyncDatabaseManager().get_user_price_alerts(user_id=message.from_user.id)
+    await message.answer(generate_alerts_text(alerts), reply_markup=generate_alerts_keyboard(alerts))
+
+
+@price_alert_router.callback_query(F.data.startswith('alert_delete:'))
+async def handle_delete_alert(callback_query: CallbackQuery):
+    alert_id = int(callback_query.data.split(':')[1])
+    await AsyncDatabaseManager().delete_price_alert(alert_id=alert_id, user_id=callback_query.from_user.id)
+    try:
+        await callback_query.answer('🗑 هشدار حذف شد.')
+    except:
+        pass
+
+    alerts = await AsyncDatabaseManager().get_user_price_alerts(user_id=callback_query.from_user.id)
+    await callback_query.message.edit_text(generate_alerts_text(alerts), reply_markup=generate_alerts_keyboard(alerts))
+
+
+@price_alert_router.callback_query(F.data == 'alert_new')
+async def handle_new_alert(callback_query: CallbackQuery, state: FSMContext):
+    alerts = await AsyncDatabaseManager().get_user_price_alerts(user_id=callback_query.from_user.id)
+    if len(alerts) >= MAX_ALERTS_PER_USER:
+        await callback_query.answer(f'حداکثر {MAX_ALERTS_PER_USER} هشدار میتونی داشته باشی.')
+        return
+    try:
+        await callback_query.answer('درحال پردازش')
+    except:
+        pass
+
+    await state.set_state(AlertForm.crypto)
+    await callback_query.message.answer(ask_symbol_text, reply_markup=ReplyKeyboardRemove())
+
+
+@price_alert_router.message(AlertForm.crypto, F.text)
+async def handle_alert_crypto(message: Message, state: FSMContext):
+    crypto = await crypto_catalog.get_crypto_by_symbol(message.text.strip())
+    if not crypto:
+        await message.reply('ارزی با این نماد پیدا نشد! دوباره امتحان کن.')
+        return
+
+    await state.update_data(crypto_id=crypto.id)
+    await state.set_state(AlertForm.direction)
+    await message.answer(
+        ask_direction_text.format(crypto_name=crypto.name),
+        reply_markup=ReplyKeyboardMarkup(
+            keyboard=[[KeyboardButton(text=text)] for text in DIRECTION_BUTTONS.values()],
+            resize_keyboard=True
+        )
+    )
+
+
+@price_alert_router.message(AlertForm.direction, F.text)
+async def handle_alert_direction(message: Message, state: FSMContext):
+    for direction, text in DIRECTION_BUTTONS.items():
+        if message.text == text:
+            data = await state.update_data(direction=direction.value)
+            await state.set_state(AlertForm.threshold)
+
+            cryptos = await crypto_catalog.get_cryptos_by_id()
+            prices = await get_latest_prices(crypto_ids=[data['crypto_id']])
+            await message.answer(
+                ask_threshold_text.format(crypto_name=cryptos[data['crypto_id']].name,
+                                          price=prices.get(data['crypto_id'], '-')),
+                reply_markup=ReplyKeyboardRemove()
+            )
+            return
+
+    await message.reply("متوجه منظورت نمیشم! از دکمه های پایین استفاده کن!")
+
+
+@price_alert_router.message(AlertForm.threshold, F.text)
+async def handle_alert_threshold(message: Message, state: FSMContext):
+    try:
+        threshold = float(message.text.strip().replace(',', ''))
+    except ValueError:
+        threshold = 0
+    if threshold <= 0 or threshold >= MAX_THRESHOLD:
+        await message.reply('لطفا قیمت رو به صورت عدد وارد کن🙂')
+        return
+
+    data = await state.get_data()
+    await state.clear()
+    direction = AlertDirection(data['direction'])
+    await AsyncDatabaseManager().create_price_alert(user_id=message.from_user.id,
+                                                    crypto_id=data['crypto_id'],
+                                                    direction=direction,
+                                                    threshold=threshold)
+
+    cryptos = await crypto_catalog.get_cryptos_by_id()
+    crypto = cryptos.get(data['crypto_id'])
+    await message.answer(
+        alert_created_text.format(crypto_name=crypto.name if crypto else '',
+                                  direction=ALERT_DIRECTION_TEXT[direction],
+                                  threshold=threshold),
+        reply_markup=generate_main_keyboard()
+    )
+
+
+def generate_alerts_text(alerts: List[PriceAlert]) -> str:
+    if not alerts:
+        return '<b>🔔 هنوز هشدار قیمتی نساختی!</b>'
+    alerts_formated = [f"🔹{alert.crypto.name} {ALERT_DIRECTION_TEXT[alert.direction]} <code>{alert.threshold}</code>💲"
+                       for alert in alerts]
+    return your_alerts_text.format(alerts='\n'.join(alerts_formated))
+
+
+def generate_alerts_keyboard(alerts: List[PriceAlert]) -> InlineKeyboardMarkup:
+    buttons = []
+    for alert in alerts:
+        text = f"🗑 {alert.crypto.symbol} {ALERT_DIRECTION_TEXT[alert.direction]} {alert.threshold}"
+        buttons.append([InlineKeyboardButton(text=text, callback_data=f"alert_delete:{alert.id}")])
+    buttons.append([InlineKeyboardButton(text="➕ هشدار جدید", callback_data="alert_new")])
+
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
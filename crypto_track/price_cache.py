@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+from crypto_track.database.manager import AsyncDatabaseManager
+
+
+class LatestPriceCache:
+    # Process wide "crypto id -> latest price" map. Writers build a new dict and swap it in,
+    # so readers never see a half applied update.
+
+    def __init__(self, max_age: timedelta = timedelta(minutes=30)):
+        self.max_age = max_age
+        self._prices: dict[int, float] = {}
+        # Bumped on every write, lets readers tell whether prices changed since they last looked.
+        self.version = 0
+        # When prices were last written by a price update, a stream tick or a full load from the
+        # database, None until then.
+        self.updated_at: Optional[datetime] = None
+
+    def set_prices(self, prices: dict[int, float], updated_at: Optional[datetime] = None):
+        self._prices = {**self._prices, **prices}
+        self.version += 1
+        if updated_at:
+            self.updated_at = updated_at
+
+    def set_price(self, crypto_id: int, price: float):
+        # Single price writes (stream ticks) don't need the swap, one key can't be half applied.
+        self._prices[crypto_id] = price
+        self.version += 1
+        self.updated_at = datetime.now(timezone.utc)
+
+    def get_prices(self, crypto_ids: Optional[Iterable[int]] = None) -> dict[int, float]:
+        if crypto_ids is None:
+            return self._prices.copy()
+        prices = self._prices
+        return {crypto_id: prices[crypto_id] for crypto_id in crypto_ids if crypto_id in prices}
+
+    def is_stale(self) -> bool:
+        return self.updated_at is None or datetime.now(timezone.utc) - self.updated_at > self.max_age
+
+    def clear(self):
+        self._prices = {}
+        self.version += 1
+        self.updated_at = None
+
+
+latest_prices = LatestPriceCache()
+
+
+async def get_latest_prices(crypto_ids: Optional[list[int]] = None) -> dict[int, float]:
+    # Reads from the cache and only goes to the database for prices it does not have yet, or for
+    # all of them on a cold start and when the cache has not been updated for too long.
+    if latest_prices.is_stale():
+        missing_ids = None
+    elif crypto_ids is None:
+        missing_ids = []
+    else:
+        cached_prices = latest_prices.get_prices(crypto_ids)
+        missing_ids = [crypto_id for crypto_id in crypto_ids if crypto_id not in cached_prices]
+
+    if missing_ids is None or missing_ids:
+        cryptos = await AsyncDatabaseManager().get_multiple_cryptos_current_price(crypto_ids=missing_ids)
+        # Only a full load makes the other cached prices as fresh as the database.
+        latest_prices.set_prices({crypto.id: crypto.last_price for crypto in cryptos},
+                                 updated_at=datetime.now(timezone.utc) if missing_ids is None else None)
+
+    return latest_prices.get_prices(crypto_ids)
+
+
+async def load_stored_prices():
+    # For nodes that don't fetch prices themselves: takes over what the fetching node stored.
+    cryptos = await AsyncDatabaseManager().get_multiple_cryptos_current_price()
+    latest_prices.set_prices({crypto.id: crypto.last_price for crypto in cryptos},
+                             updated_at=datetime.now(timezone.utc))
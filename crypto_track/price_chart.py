@@ -0,0 +1,60 @@
+from aiogram import Router, F
+from aiogram.types import (Message,
+                           CallbackQuery,
+                           ReplyKeyboardRemove,
+                           InlineKeyboardMarkup,
+                           InlineKeyboardButton)
+from crypto_track.charts import ChartService
+from crypto_track.database.manager import AsyncDatabaseManager
+from crypto_track.history import HISTORY_WINDOWS
+
+
+def load_price_chart_messages():
+    with open('messages/crypto_price/account_not_exists.txt', 'r', encoding='utf-8') as file:
+        account_not_exists_text = file.read()
+    with open('messages/chart/choose_window.txt', 'r', encoding='utf-8') as file:
+        choose_window_text = file.read()
+
+    return account_not_exists_text, choose_window_text
+account_not_exists_text, choose_window_text = load_price_chart_messages()
+
+price_chart_router = Router()
+
+
+@price_chart_router.message(F.text == 'نمودار قیمت 📊')
+async def ask_chart_window(message: Message):
+    user = await AsyncDatabaseManager().check_user_exists(user_id=message.from_user.id)
+    if not user:
+        await message.reply(account_not_exists_text, reply_markup=ReplyKeyboardRemove())
+        return
+
+    await message.answer(
+        choose_window_text,
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=window, callback_data=f'chart:{window}') for window in HISTORY_WINDOWS]
+        ])
+    )
+
+
+@price_chart_router.callback_query(F.data.startswith('chart:'))
+async def send_price_charts(callback_query: CallbackQuery):
+    window = callback_query.data.split(':')[1]
+    user = await AsyncDatabaseManager().get_user_with_cryptos(user_id=callback_query.from_user.id)
+    if not user or window not in HISTORY_WINDOWS:
+        await callback_query.answer('این گزینه دیگه معتبر نیست!')
+        return
+    try:
+        await callback_query.answer('درحال رسم نمودار')
+    except:
+        pass
+
+    sent = 0
+    for crypto in sorted(user.tracking_cryptos, key=lambda crypto: crypto.id):
+        if await ChartService().send_chart(callback_query.bot,
+                                           chat_id=callback_query.message.chat.id,
+                                           crypto=crypto,
+                                           window=window,
+                                           caption=f'📊 {crypto.name} ({window})'):
+            sent += 1
+    if not sent:
+        await callback_query.message.answer('هنوز قیمت کافی برای رسم نمودار ارز هات ثبت نشده!')
@@ -0,0 +1,50 @@
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+from crypto_track.catalog import crypto_catalog
+from crypto_track.history import HISTORY_WINDOWS, MOVING_AVERAGE_POINTS, history_service
+
+
+def load_history_messages():
+    with open('messages/history/price_history.txt', 'r', encoding='utf-8') as file:
+        price_history_text = file.read()
+    with open('messages/history/history_usage.txt', 'r', encoding='utf-8') as file:
+        history_usage_text = file.read()
+
+    return price_history_text, history_usage_text
+price_history_text, history_usage_text = load_history_messages()
+
+DEFAULT_WINDOW = '24h'
+
+price_history_router = Router()
+
+
+@price_history_router.message(Command('history'))
+async def get_price_history(message: Message, command: CommandObject):
+    args = (command.args or '').split()
+    window = args[1].lower() if len(args) > 1 else DEFAULT_WINDOW
+    if not args or window not in HISTORY_WINDOWS:
+        await message.reply(history_usage_text.format(windows=', '.join(HISTORY_WINDOWS)))
+        return
+
+    crypto = await crypto_catalog.get_crypto_by_symbol(args[0])
+    if not crypto:
+        await message.reply('ارزی با این نماد پیدا نشد!')
+        return
+
+    stats = await history_service.get_stats(crypto.id, window)
+    if not stats:
+        await message.reply('هنوز قیمتی برای این ارز در این بازه ثبت نشده!')
+        return
+
+    await message.answer(price_history_text.format(crypto_name=crypto.name,
+                                                   window=window,
+                                                   first=stats.first,
+                                                   last=stats.last,
+                                                   change_percent=stats.change_percent,
+                                                   low=stats.low,
+                                                   high=stats.high,
+                                                   moving_average_points=min(MOVING_AVERAGE_POINTS, stats.points),
+                                                   moving_average=stats.moving_average,
+                                                   volatility_percent=stats.volatility_percent,
+                                                   points=stats.points))
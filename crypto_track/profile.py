@@ -1,9 +1,11 @@
-from typing import List
+from typing import Optional, Set
 from aiogram import Router, F
 from crypto_track.database.manager import AsyncDatabaseManager
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from crypto_track.database.models import Crypto
+from aiogram.exceptions import TelegramBadRequest
+from crypto_track.catalog import crypto_catalog, parse_crypto_selection_data, crypto_filter_text
+from crypto_track.fsm_storage import toggle_data_item
 from crypto_track.enums import TimeOptions
 from crypto_track.uils import generate_main_keyboard
 from aiogram.types import (Message,
@@ -134,13 +136,13 @@ async def handle_edit_tracking_cryptos_query(callback_query: CallbackQuery, stat
     
     await state.set_state(UpdateState.tracking_cryptos)
 
-    available_cryptos = await AsyncDatabaseManager().get_all_cryptos()
-    user_cryptos = [str(crypto.id) for crypto in user.tracking_cryptos]
-    await state.update_data(tracking_cryptos=user_cryptos)
+    user_cryptos = sorted(crypto.id for crypto in user.tracking_cryptos)
+    await state.update_data(tracking_cryptos=user_cryptos, crypto_filter=None)
     
     await callback_query.message.answer(
-            "<b>ارز هایی که بهشون علاقه مند هستین رو انتخاب کنین👇</b>",
-            reply_markup=generate_crypto_selection_keyboard_update(available_cryptos, user_cryptos))
+            "<b>ارز هایی که بهشون علاقه مند هستین رو انتخاب کنین👇</b>\n"
+            "🔎 برای جستجو، نماد ارز (مثلا BTC) رو بفرستین.",
+            reply_markup=await generate_crypto_selection_keyboard_update(set(user_cryptos)))
 
 @profile_router.callback_query(F.data.startswith('select_crypto_update:'))
 async def handle_crypto_selection(callback_query: CallbackQuery, state: FSMContext):
@@ -148,20 +150,50 @@ async def handle_crypto_selection(callback_query: CallbackQuery, state: FSMConte
         await callback_query.answer('درحال پردازش')
     except:
         pass
-    crypto_id = callback_query.data.split(':')[1]
+    crypto_id, page = parse_crypto_selection_data(callback_query.data)
+    data = await toggle_data_item(state, 'tracking_cryptos', crypto_id)
+    selected_cryptos = set(data['tracking_cryptos'])
+
+    await callback_query.message.edit_reply_markup(
+        reply_markup=await generate_crypto_selection_keyboard_update(selected_cryptos,
+                                                                     page=page,
+                                                                     symbol_prefix=data.get('crypto_filter')))
+
+@profile_router.callback_query(F.data.startswith('select_crypto_update_page:'))
+async def handle_crypto_selection_page(callback_query: CallbackQuery, state: FSMContext):
+    try:
+        await callback_query.answer()
+    except:
+        pass
+    page = int(callback_query.data.split(':')[1])
     data = await state.get_data()
-    selected_cryptos = data.get('tracking_cryptos', [])
-    
-    if crypto_id not in selected_cryptos:
-        selected_cryptos.append(crypto_id)
-    else:
-        selected_cryptos.remove(crypto_id)
-    
-    await state.update_data(tracking_cryptos=selected_cryptos)
+    try:
+        await callback_query.message.edit_reply_markup(
+            reply_markup=await generate_crypto_selection_keyboard_update(set(data.get('tracking_cryptos', [])),
+                                                                         page=page,
+                                                                         symbol_prefix=data.get('crypto_filter')))
+    except TelegramBadRequest:
+        # Tapping the current page number doesn't change the keyboard.
+        pass
 
-    # This is not very good to query cryptos each time but it is a good way for now.
-    cryptos = await AsyncDatabaseManager().get_all_cryptos()
-    await callback_query.message.edit_reply_markup(reply_markup=generate_crypto_selection_keyboard_update(cryptos, selected_cryptos))
+@profile_router.callback_query(F.data == 'select_crypto_update_clear_filter')
+async def handle_crypto_selection_clear_filter(callback_query: CallbackQuery, state: FSMContext):
+    try:
+        await callback_query.answer()
+    except:
+        pass
+    data = await state.update_data(crypto_filter=None)
+    await callback_query.message.edit_reply_markup(
+        reply_markup=await generate_crypto_selection_keyboard_update(set(data.get('tracking_cryptos', []))))
+
+@profile_router.message(UpdateState.tracking_cryptos, F.text.regexp(r'^\s*[A-Za-z0-9]{1,10}\s*$'))
+async def handle_crypto_selection_filter(message: Message, state: FSMContext):
+    symbol_prefix = message.text.strip().upper()
+    data = await state.update_data(crypto_filter=symbol_prefix)
+    await message.answer(
+        crypto_filter_text.format(symbol_prefix=symbol_prefix),
+        reply_markup=await generate_crypto_selection_keyboard_update(set(data.get('tracking_cryptos', [])),
+                                                                     symbol_prefix=symbol_prefix))
 
 @profile_router.callback_query(F.data == 'done_selecting_cryptos_update')
 async def handle_done_selecting_cryptos(callback_query: CallbackQuery, state: FSMContext):
@@ -187,17 +219,14 @@ async def handle_done_selecting_cryptos(callback_query: CallbackQuery, state: FS
         )
 
 
-def generate_crypto_selection_keyboard_update(available_cryptos: List[Crypto], chosen_cryptos_ids: List[str]):
-    buttons = []
-    for crypto in available_cryptos:
-        text = f"{'✔️ ' if str(crypto.id) in chosen_cryptos_ids else ''}{crypto.name}"
-        callback_data = f"select_crypto_update:{crypto.id}"
-        buttons.append([InlineKeyboardButton(text=text, callback_data=callback_data)])
-
-    buttons.append([InlineKeyboardButton(text="✅ پایان", callback_data="done_selecting_cryptos_update")])
-
-    keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
-    return keyboard
+async def generate_crypto_selection_keyboard_update(chosen_cryptos_ids: Set[int],
+                                                   page: int = 0,
+                                                   symbol_prefix: Optional[str] = None) -> InlineKeyboardMarkup:
+    return await crypto_catalog.get_selection_keyboard(callback_prefix='select_crypto_update',
+                                                       done_callback_data='done_selecting_cryptos_update',
+                                                       selected_ids=chosen_cryptos_ids,
+                                                       page=page,
+                                                       symbol_prefix=symbol_prefix)
 
 def generate_edit_profile_keyboard() -> InlineKeyboardMarkup:
     buttons = []
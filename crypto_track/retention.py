@@ -0,0 +1,82 @@
+import os
+from datetime import datetime, timedelta, timezone
+from crypto_track.database.manager import AsyncDatabaseManager, CANDLES_BACKFILL, as_utc, calculate_bucket_start
+from crypto_track.database.models import BackfillCursor
+from crypto_track.enums import Resolution
+from crypto_track.coordination import NodeCoordinator
+
+
+class RetentionPolicy:
+    # Raw prices are kept for raw_days, hourly candles for hourly_days and daily candles forever.
+    def __init__(self,
+                 raw_days: int = 7,
+                 hourly_days: int = 90,
+                 batch_hours: int = 6,
+                 batch_days: int = 7,
+                 outbox_days: int = 7):
+        self.raw_days = raw_days
+        self.hourly_days = hourly_days
+        # Sent, blocked and failed outbox messages are kept for outbox_days.
+        self.outbox_days = outbox_days
+        # How much history is deleted per transaction.
+        self.batch_hours = batch_hours
+        self.batch_days = batch_days
+
+    @classmethod
+    def from_env(cls) -> 'RetentionPolicy':
+        return cls(raw_days=int(os.getenv('PRICES_RAW_RETENTION_DAYS', 7)),
+                   hourly_days=int(os.getenv('PRICES_HOURLY_RETENTION_DAYS', 90)),
+                   batch_hours=int(os.getenv('PRICES_RETENTION_BATCH_HOURS', 6)),
+                   batch_days=int(os.getenv('PRICES_RETENTION_BATCH_DAYS', 7)),
+                   outbox_days=int(os.getenv('OUTBOX_RETENTION_DAYS', 7)))
+
+
+async def compact_prices(policy: RetentionPolicy = None):
+    if not await NodeCoordinator().is_leader():
+        return
+    policy = policy or RetentionPolicy.from_env()
+    now = datetime.now(timezone.utc)
+    try:
+        # The cursor is created by the database migrations.
+        cursor = await AsyncDatabaseManager().get_backfill_cursor(CANDLES_BACKFILL)
+        raw_before, hourly_before = retention_limits(policy, cursor, now)
+        raw_rows = await delete_old_prices(before=raw_before, batch=timedelta(hours=policy.batch_hours))
+        hourly_rows = await delete_old_hourly_rollups(before=hourly_before, batch=timedelta(days=policy.batch_days))
+        outbox_rows = await AsyncDatabaseManager().delete_outbox_messages(before=now - timedelta(days=policy.outbox_days))
+        print(f'Prices compacted. raw={raw_rows}, hourly={hourly_rows}, outbox={outbox_rows}')
+    except Exception as ex:
+        print(f'\u001b[31mException happend while compacting prices.\nDetail:{ex}\u001b[37m')
+
+
+def retention_limits(policy: RetentionPolicy, cursor: BackfillCursor, now: datetime) -> tuple[datetime, datetime]:
+    # Returns the dates raw prices and hourly candles are deleted before. Candles are built as prices
+    # are stored, only while the candle backfill is pending the prices it has not folded yet are kept.
+    raw_before = calculate_bucket_start(now - timedelta(days=policy.raw_days), Resolution.HOUR)
+    hourly_before = calculate_bucket_start(now - timedelta(days=policy.hourly_days), Resolution.DAY)
+    if as_utc(cursor.position) < as_utc(cursor.end_at):
+        folded_before = calculate_bucket_start(cursor.position, Resolution.HOUR)
+        raw_before, hourly_before = min(raw_before, folded_before), min(hourly_before, folded_before)
+    return raw_before, hourly_before
+
+
+async def delete_old_prices(before: datetime, batch: timedelta) -> int:
+    # Walks from the oldest raw price up to `before` (an hour boundary), one batch per transaction.
+    deleted = 0
+    while True:
+        oldest = await AsyncDatabaseManager().get_oldest_price_date(before=before)
+        if oldest is None:
+            return deleted
+        start = calculate_bucket_start(oldest, Resolution.HOUR)
+        end = min(start + batch, before)
+        deleted += await AsyncDatabaseManager().delete_prices(start=start, end=end)
+
+
+async def delete_old_hourly_rollups(before: datetime, batch: timedelta) -> int:
+    deleted = 0
+    while True:
+        oldest = await AsyncDatabaseManager().get_oldest_rollup_date(resolution=Resolution.HOUR, before=before)
+        if oldest is None:
+            return deleted
+        start = calculate_bucket_start(oldest, Resolution.HOUR)
+        end = min(start + batch, before)
+        deleted += await AsyncDatabaseManager().delete_rollups(resolution=Resolution.HOUR, start=start, end=end)
@@ -1,20 +1,21 @@
-from typing import List
+from typing import List, Optional, Set
 from crypto_track.database.manager import AsyncDatabaseManager
 from crypto_track.enums import TimeOptions
 from aiogram.fsm.context import FSMContext
 from aiogram import Router, F
 from aiogram.filters import CommandStart
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import (
     KeyboardButton,
     Message,
     ReplyKeyboardMarkup,
     ReplyKeyboardRemove,
-    InlineKeyboardButton, 
     InlineKeyboardMarkup, 
     CallbackQuery,
 )
-from crypto_track.database.models import Crypto
+from crypto_track.catalog import crypto_catalog, parse_crypto_selection_data, crypto_filter_text
+from crypto_track.fsm_storage import toggle_data_item
 from crypto_track.uils import generate_main_keyboard
 
 
@@ -93,14 +94,13 @@ async def handle_how_often(message: Message, state: FSMContext):
     how_often = message.text
     for time_option in TimeOptions:
         if how_often == f'⏳ هر {time_option.value} دقیقه یکبار':
-            data = await state.update_data(how_often=time_option)
+            # FSM data is stored as JSON, so the enum's value is kept.
+            data = await state.update_data(how_often=time_option.value)
             await state.set_state(SignUpForm.tracked_cryptos)
-            # 👇
-            available_cryptos = await AsyncDatabaseManager().get_all_cryptos()
 
             await message.answer(
                 handle_howoften_signup_text.format(user_name=data.get('name', ''), how_often=time_option.value),
-                reply_markup=generate_crypto_selection_keyboard(available_cryptos, []))
+                reply_markup=await generate_crypto_selection_keyboard(set()))
             return
 
     await message.reply("متوجه منظورت نمیشم! از دکمه های پایین استفاده کن!")
@@ -112,20 +112,53 @@ async def handle_crypto_selection(callback_query: CallbackQuery, state: FSMConte
         await callback_query.answer('درحال پردازش')
     except:
         pass
-    crypto_id = callback_query.data.split(':')[1]
+    crypto_id, page = parse_crypto_selection_data(callback_query.data)
+    data = await toggle_data_item(state, 'tracked_cryptos', crypto_id)
+    selected_cryptos = set(data['tracked_cryptos'])
+
+    await callback_query.message.edit_reply_markup(
+        reply_markup=await generate_crypto_selection_keyboard(selected_cryptos,
+                                                              page=page,
+                                                              symbol_prefix=data.get('crypto_filter')))
+
+
+@signup_router.callback_query(F.data.startswith('select_crypto_page:'))
+async def handle_crypto_selection_page(callback_query: CallbackQuery, state: FSMContext):
+    try:
+        await callback_query.answer()
+    except:
+        pass
+    page = int(callback_query.data.split(':')[1])
     data = await state.get_data()
-    selected_cryptos = data.get('tracked_cryptos', [])
-    
-    if crypto_id not in selected_cryptos:
-        selected_cryptos.append(crypto_id)
-    else:
-        selected_cryptos.remove(crypto_id)
-    
-    await state.update_data(tracked_cryptos=selected_cryptos)
+    try:
+        await callback_query.message.edit_reply_markup(
+            reply_markup=await generate_crypto_selection_keyboard(set(data.get('tracked_cryptos', [])),
+                                                                  page=page,
+                                                                  symbol_prefix=data.get('crypto_filter')))
+    except TelegramBadRequest:
+        # Tapping the current page number doesn't change the keyboard.
+        pass
+
+
+@signup_router.callback_query(F.data == 'select_crypto_clear_filter')
+async def handle_crypto_selection_clear_filter(callback_query: CallbackQuery, state: FSMContext):
+    try:
+        await callback_query.answer()
+    except:
+        pass
+    data = await state.update_data(crypto_filter=None)
+    await callback_query.message.edit_reply_markup(
+        reply_markup=await generate_crypto_selection_keyboard(set(data.get('tracked_cryptos', []))))
+
 
-    # This is not very good to query cryptos each time but it is a good way for now.
-    cryptos = await AsyncDatabaseManager().get_all_cryptos()
-    await callback_query.message.edit_reply_markup(reply_markup=generate_crypto_selection_keyboard(cryptos, selected_cryptos))
+@signup_router.message(SignUpForm.tracked_cryptos, F.text.regexp(r'^\s*[A-Za-z0-9]{1,10}\s*$'))
+async def handle_crypto_selection_filter(message: Message, state: FSMContext):
+    symbol_prefix = message.text.strip().upper()
+    data = await state.update_data(crypto_filter=symbol_prefix)
+    await message.answer(
+        crypto_filter_text.format(symbol_prefix=symbol_prefix),
+        reply_markup=await generate_crypto_selection_keyboard(set(data.get('tracked_cryptos', [])),
+                                                              symbol_prefix=symbol_prefix))
 
 
 @signup_router.callback_query(F.data == 'done_selecting_cryptos')
@@ -153,7 +186,7 @@ async def handle_done_selecting_cryptos(callback_query: CallbackQuery, state: FS
             pass
         new_user = await AsyncDatabaseManager().create_new_user_and_add_cryptos(user_id=callback_query.from_user.id,
                                                                                 user_name=data['name'],
-                                                                                how_often=data['how_often'],
+                                                                                how_often=TimeOptions(data['how_often']),
                                                                                 cryptos_to_add_ids=data['tracked_cryptos'])
         await callback_query.message.answer(
             generate_newuser_welcome(name=new_user.name, how_often=new_user.how_often, tracking_cryptos=data['tracked_cryptos']),
@@ -161,17 +194,14 @@ async def handle_done_selecting_cryptos(callback_query: CallbackQuery, state: FS
             )
 
 
-def generate_crypto_selection_keyboard(available_cryptos: List[Crypto], chosen_cryptos_ids: List[str]):
-    buttons = []
-    for crypto in available_cryptos:
-        text = f"{'✔️ ' if str(crypto.id) in chosen_cryptos_ids else ''}{crypto.name}"
-        callback_data = f"select_crypto:{crypto.id}"
-        buttons.append([InlineKeyboardButton(text=text, callback_data=callback_data)])
-
-    buttons.append([InlineKeyboardButton(text="✅ پایان", callback_data="done_selecting_cryptos")])
-
-    keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
-    return keyboard
+async def generate_crypto_selection_keyboard(chosen_cryptos_ids: Set[int],
+                                            page: int = 0,
+                                            symbol_prefix: Optional[str] = None) -> InlineKeyboardMarkup:
+    return await crypto_catalog.get_selection_keyboard(callback_prefix='select_crypto',
+                                                       done_callback_data='done_selecting_cryptos',
+                                                       selected_ids=chosen_cryptos_ids,
+                                                       page=page,
+                                                       symbol_prefix=symbol_prefix)
 
 
 def generate_newuser_welcome(name: str, how_often: str, tracking_cryptos: List):
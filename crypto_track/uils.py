@@ -6,7 +6,8 @@ def generate_main_keyboard() -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text='پروفایل 🧒')],
-            [KeyboardButton(text='دریافت قیمت لحظه ای 📈')]
+            [KeyboardButton(text='دریافت قیمت لحظه ای 📈'), KeyboardButton(text='نمودار قیمت 📊')],
+            [KeyboardButton(text='هشدار قیمت 🔔')]
         ],
         resize_keyboard=True
     )
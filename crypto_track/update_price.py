@@ -1,57 +1,154 @@
-from crypto_track.database.manager import AsyncDatabaseManager
+import asyncio
+from crypto_track.database.manager import AsyncDatabaseManager, as_utc
 from crypto_track.api.manager import AsyncAPIManager
-from crypto_track.bot import bot
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 from crypto_track.database.models import Crypto
-from aiogram.exceptions import TelegramForbiddenError
+from crypto_track.price_cache import latest_prices, get_latest_prices, load_stored_prices
+from crypto_track.alert_index import check_price_alerts
+from crypto_track.coordination import NodeCoordinator
+from crypto_track.history import PriceStats, history_service
+from crypto_track.metrics import TICK_SECONDS, USERS_DUE
 
 
 with open('messages/crypto_price/price_list.txt', 'r', encoding='utf-8') as file:
         price_list_text = file.read()
 
 
-async def update_prices_manager():
-    cryptos = await update_all_cryptos()
-    users = await AsyncDatabaseManager().get_multiple_users_with_cryptos()
-    cryptos_id_price_dict = generate_id_price_cryptos_dict(cryptos)
+DUE_USERS_BATCH_SIZE = 500
+ENQUEUE_CHUNK_SIZE = 200
+# The job interval and every TimeOptions value are multiples of 10 minutes, so a user
+# who becomes due a few seconds after the tick starts should still be updated in it.
+DUE_TOLERANCE = timedelta(seconds=30)
+# Window of the change shown next to every price of the digests.
+DIGEST_CHANGE_WINDOW = '24h'
+# How long other nodes wait for the leader to store the prices of the tick, they send the
+# previously stored prices after that.
+LEADER_PRICES_TIMEOUT = timedelta(minutes=2)
+LEADER_PRICES_POLL_SECONDS = 5
 
-    for user in users:
-        now = datetime.now(user.last_update.tzinfo)
-        minutes_ago = round(((now - user.last_update).total_seconds() / 60))
 
-        if minutes_ago >= int(user.how_often.value):
-            await send_update_to_user(user, cryptos_id_price_dict)
-            await AsyncDatabaseManager().update_user(user_id=user.id, new_last_update=now)
-            
+async def update_prices_manager(fetch_prices: bool = True):
+    with TICK_SECONDS.time(phase='total'):
+        await run_update_tick(fetch_prices)
 
-def generate_id_price_cryptos_dict(cryptos):
-    return {crypto.id: crypto.current_price.price for crypto in cryptos}
 
-async def send_update_to_user(user, cryptos_id_price):
-    new_update = {}
-    for crypto in user.tracking_cryptos:
-        new_update[crypto] = cryptos_id_price.get(crypto.id)
-
-    prices_formated = [f"🔹{crypto.name}: <code>{price}</code>💲" for crypto, price in new_update.items()]
-    
+async def run_update_tick(fetch_prices: bool):
+    # Renders the messages and queues them in the outbox, the outbox worker sends them.
+    coordinator = NodeCoordinator()
+    tick_start = datetime.now(timezone.utc)
+    if await coordinator.is_leader():
+        with TICK_SECONDS.time(phase='fetch'):
+            # In stream mode the price streamer keeps prices current, the tick only notifies users.
+            updated_prices = await update_all_cryptos() if fetch_prices else latest_prices.get_prices()
+        if updated_prices:
+            with TICK_SECONDS.time(phase='alerts'):
+                alerts_enqueued = await check_price_alerts(updated_prices)
+            print(f'Price alerts enqueued. count={alerts_enqueued}')
+    elif fetch_prices:
+        with TICK_SECONDS.time(phase='fetch'):
+            # The leader fetches and stores the prices, pick them up from the database once it did.
+            if not await wait_for_leader_prices(tick_start):
+                print('\u001b[31mThe leader did not store the prices of this tick in time, '
+                      'sending the previously stored ones.\u001b[37m')
+            await load_stored_prices()
+    # Falls back to the last stored prices when the update failed.
+    cryptos_id_price_dict = await get_latest_prices()
     try:
-        await bot.send_message(chat_id=user.id ,text=price_list_text.format(cryptos_prices='\n'.join(prices_formated)))
-    except TelegramForbiddenError:
-        print(f'User [{user.id}] has blocked the bot.')
+        with TICK_SECONDS.time(phase='history'):
+            cryptos_stats = await history_service.get_many_stats(cryptos_id_price_dict, DIGEST_CHANGE_WINDOW)
     except Exception as ex:
-        print(f'Something went wrong whilte sending update to user [{user.id}].\nDetail: {ex}.')
+        # The digests are still sent, without the change.
+        print(f'\u001b[31mException happend while computing price changes.\nDetail:{ex}\u001b[37m')
+        cryptos_stats = {}
+
+    # Users are rescheduled in the same transaction their messages are queued in.
+    with TICK_SECONDS.time(phase='enqueue'):
+        enqueued = 0
+        messages = []
+        async for message in generate_due_updates(cryptos_id_price_dict, cryptos_stats, shard=coordinator.shard):
+            messages.append(message)
+            if len(messages) >= ENQUEUE_CHUNK_SIZE:
+                enqueued += await enqueue_updates(messages)
+                messages = []
+        enqueued += await enqueue_updates(messages)
+    USERS_DUE.inc(enqueued)
+    print(f'Price updates enqueued. count={enqueued}')
+
+
+async def wait_for_leader_prices(tick_start: datetime) -> bool:
+    # Every node runs the tick on the same 10 minute boundaries, so the leader's prices of this tick
+    # are stored once the newest last_price_at gets to (about) the tick start.
+    deadline = tick_start + LEADER_PRICES_TIMEOUT
+    while True:
+        last_price_date = await AsyncDatabaseManager().get_last_price_date()
+        if last_price_date and as_utc(last_price_date) >= tick_start - DUE_TOLERANCE:
+            return True
+        if datetime.now(timezone.utc) >= deadline:
+            return False
+        await asyncio.sleep(LEADER_PRICES_POLL_SECONDS)
+
+
+async def enqueue_updates(messages: list[tuple[int, str, str]]) -> int:
+    if not messages:
+        return 0
+    return await AsyncDatabaseManager().enqueue_outbox_messages(messages=messages,
+                                                                updated_user_ids=[chat_id for chat_id, _, _ in messages],
+                                                                timestamp=datetime.now(timezone.utc))
+
+
+async def generate_due_updates(cryptos_id_price: dict,
+                               cryptos_stats: Optional[dict[int, PriceStats]] = None,
+                               shard: Optional[tuple[int, int]] = None):
+    # Yields (user_id, text, idempotency key) for every due user (of this node's shard), one page
+    # of users at a time. The key is the user's schedule slot, so a slot is never queued twice.
+    # Users tracking the same set of cryptos share one rendered message.
+    rendered_updates: dict[frozenset, str] = {}
+    due_at = datetime.now(timezone.utc) + DUE_TOLERANCE
+    last_user_id = None
+    while True:
+        users = await AsyncDatabaseManager().get_due_users(now=due_at,
+                                                           limit=DUE_USERS_BATCH_SIZE,
+                                                           after_id=last_user_id,
+                                                           shard=shard)
+        for user in users:
+            portfolio = frozenset(crypto.id for crypto in user.tracking_cryptos)
+            text = rendered_updates.get(portfolio)
+            if text is None:
+                text = generate_update_text(user.tracking_cryptos, cryptos_id_price, cryptos_stats)
+                rendered_updates[portfolio] = text
+            yield user.id, text, f'update:{user.id}:{user.next_due_at:%Y%m%d%H%M}'
+
+        if len(users) < DUE_USERS_BATCH_SIZE:
+            break
+        last_user_id = users[-1].id
+
+
+def generate_update_text(tracking_cryptos: list[Crypto],
+                         cryptos_id_price: dict,
+                         cryptos_stats: Optional[dict[int, PriceStats]] = None) -> str:
+    prices_formated = [f"🔹{crypto.name}: <code>{cryptos_id_price.get(crypto.id)}</code>💲"
+                       f"{format_price_change((cryptos_stats or {}).get(crypto.id))}"
+                       for crypto in sorted(tracking_cryptos, key=lambda crypto: crypto.id)]
+    return price_list_text.format(cryptos_prices='\n'.join(prices_formated))
+
+
+def format_price_change(stats: Optional[PriceStats]) -> str:
+    if not stats or stats.points < 2:
+        return ''
+    return f" {'📈' if stats.change_percent >= 0 else '📉'}<code>{stats.change_percent:+.2f}%</code>"
 
 
-async def update_all_cryptos() -> list[Crypto]:
-    available_cryptos = await AsyncDatabaseManager().get_all_cryptos()
-    cryptos_symbols_list = [crypto.symbol for crypto in available_cryptos]
+async def update_all_cryptos() -> dict[int, float]:
+    cryptos_symbols_list = await AsyncDatabaseManager().get_all_crypto_symbols()
     try:
         update_raw_data = await AsyncAPIManager().get_crpyto_prices(cryptos_symbols_list)
         update_data = {key: value['USD'] for key, value in update_raw_data.items()}
         
-        updated_cryptos = await AsyncDatabaseManager().update_cryptos_prices_by_symbol(data=update_data)
+        updated_prices = await AsyncDatabaseManager().update_cryptos_prices_by_symbol(data=update_data)
+        latest_prices.set_prices(updated_prices, updated_at=datetime.now(timezone.utc))
 
-        return updated_cryptos
+        return updated_prices
     except ConnectionError:
         print('\u001b[31mConnection error happend while trying to update Crypto List.\u001b[37m')
     except Exception as ex:
@@ -0,0 +1,31 @@
+from typing import Optional
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+
+def create_webhook_app(dispatcher: Dispatcher, bot: Bot, path: str, secret_token: Optional[str] = None) -> web.Application:
+    # Updates are acknowledged right away and handled in the background, so a slow handler
+    # doesn't hold the request (and Telegram's retries) open.
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dispatcher,
+                         bot=bot,
+                         handle_in_background=True,
+                         secret_token=secret_token).register(app, path=path)
+    app.router.add_get('/health', health)
+    setup_application(app, dispatcher, bot=bot)
+    return app
+
+
+async def health(request: web.Request) -> web.Response:
+    return web.Response(text='ok')
+
+
+async def serve_webhook_app(app: web.Application, host: str, port: int) -> web.AppRunner:
+    # reuse_port lets every worker process bind the same port, the kernel spreads the
+    # connections between them.
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port, reuse_port=True)
+    await site.start()
+    return runner
@@ -1,40 +1,185 @@
 import os
 import asyncio
 import logging
+import multiprocessing
+import signal
 import sys
 import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from crypto_track.bot import bot
 from sqlalchemy.ext.asyncio import async_sessionmaker
 from crypto_track.database.run import init_db
 from crypto_track.database.manager import AsyncDatabaseManager
 from crypto_track.api.manager import AsyncAPIManager
+from crypto_track.api.stream import AsyncPriceStreamer
+from crypto_track.coordination import NodeCoordinator
+from crypto_track.outbox import OutboxWorker
+from crypto_track.metrics import instrument_router, start_metrics_server
+from crypto_track.fsm_storage import SQLAlchemyStorage
 from aiogram import Dispatcher
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
 from crypto_track.signup import signup_router
 from crypto_track.profile import profile_router
 from crypto_track.crypto_price import crypto_price_router
+from crypto_track.price_alert import price_alert_router
+from crypto_track.price_history import price_history_router
+from crypto_track.price_chart import price_chart_router
+from crypto_track.charts import ChartService
 from crypto_track.update_price import update_prices_manager
+from crypto_track.retention import compact_prices
+from crypto_track.candles import backfill_candles
+from crypto_track.price_cache import load_stored_prices
+from crypto_track.webhook import create_webhook_app, serve_webhook_app
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from cli.manager import CLIManager
 
-dp = Dispatcher()
 # Load .env variables
 load_dotenv()
+
+
+def create_fsm_storage() -> BaseStorage:
+    # "database" keeps signup/profile flows in the bot's database (or FSM_DATABASE_URL), "memory" in this process.
+    if os.getenv('FSM_STORAGE', 'database').strip().lower() == 'memory':
+        return MemoryStorage()
+    ttl = timedelta(hours=float(os.getenv('FSM_TTL_HOURS', 24)))
+    fsm_database_url = os.getenv('FSM_DATABASE_URL')
+    if fsm_database_url:
+        return SQLAlchemyStorage.from_url(fsm_database_url, ttl=ttl)
+    return SQLAlchemyStorage(ttl=ttl)
+
+
+dp = Dispatcher(storage=create_fsm_storage())
 # Aiogram logging
 logging.basicConfig(level=logging.INFO, stream=sys.stdout)
 
 
-async def start_bot():
+def include_routers():
+    for router_name, router in (('signup', signup_router),
+                                ('profile', profile_router),
+                                ('crypto_price', crypto_price_router),
+                                ('price_alert', price_alert_router),
+                                ('price_history', price_history_router),
+                                ('price_chart', price_chart_router)):
+        instrument_router(router, router_name)
+        dp.include_router(router)
+
+
+async def start_metrics(worker_index: int = 0):
+    # Every webhook worker has its own metrics, served on METRICS_PORT + worker index.
+    metrics_port = os.getenv('METRICS_PORT')
+    if not metrics_port:
+        return None
+    return await start_metrics_server(host=os.getenv('METRICS_HOST', '127.0.0.1'),
+                                      port=int(metrics_port) + worker_index)
+
+
+@asynccontextmanager
+async def background_jobs():
+    # "poll" fetches prices every tick, "stream" keeps them current from the websocket stream.
+    stream_prices = os.getenv('PRICE_SOURCE', 'poll').strip().lower() == 'stream'
+
     scheduler = AsyncIOScheduler()
+    # On the clock's 10 minute boundaries, so the ticks of every node line up with the leader's.
     scheduler.add_job(update_prices_manager,
-                    'interval', seconds=10 * 60)
+                    'cron', minute='*/10', kwargs={'fetch_prices': not stream_prices})
+    scheduler.add_job(compact_prices,
+                    'interval', seconds=60 * 60)
+    scheduler.add_job(backfill_candles,
+                    'interval', seconds=5 * 60, next_run_time=datetime.now())
+    if isinstance(dp.storage, SQLAlchemyStorage):
+        scheduler.add_job(dp.storage.delete_expired,
+                        'interval', seconds=60 * 60)
+    scheduler.start()
+
+    outbox_worker = OutboxWorker(batch_size=int(os.getenv('OUTBOX_BATCH_SIZE', 200)),
+                                 max_attempts=int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5)))
+    outbox_task = asyncio.create_task(outbox_worker.run())
 
-    dp.include_router(signup_router)
-    dp.include_router(profile_router)
-    dp.include_router(crypto_price_router)
+    stream_task = None
+    if stream_prices:
+        streamer = AsyncPriceStreamer(api_key=os.getenv('API_KEY'),
+                                      url=os.getenv('STREAM_URL'),
+                                      flush_interval=float(os.getenv('STREAM_FLUSH_SECONDS', 60)))
+        stream_task = asyncio.create_task(streamer.run())
+    try:
+        yield
+    finally:
+        scheduler.shutdown(wait=False)
+        outbox_worker.stop()
+        outbox_task.cancel()
+        await asyncio.gather(outbox_task, return_exceptions=True)
+        if stream_task:
+            streamer.stop()
+            stream_task.cancel()
+            await asyncio.gather(stream_task, return_exceptions=True)
+        # Lets another node take over the leader jobs right away instead of after the lease expires.
+        await NodeCoordinator().release()
 
+
+@asynccontextmanager
+async def stored_prices_refresh():
+    # For processes without background_jobs(): takes over the prices the price updates store.
+    scheduler = AsyncIOScheduler()
+    scheduler.add_job(load_stored_prices,
+                    'interval', seconds=int(os.getenv('PRICE_REFRESH_SECONDS', 60)), next_run_time=datetime.now())
     scheduler.start()
-    await dp.start_polling(bot)
+    try:
+        yield
+    finally:
+        scheduler.shutdown(wait=False)
+
+
+async def start_bot():
+    include_routers()
+    async with background_jobs():
+        await dp.start_polling(bot)
+
+
+async def start_webhook(worker_index: int = 0):
+    include_routers()
+    webhook_path = os.getenv('WEBHOOK_PATH', '/webhook')
+    webhook_secret = os.getenv('WEBHOOK_SECRET')
+    app = create_webhook_app(dp, bot, path=webhook_path, secret_token=webhook_secret)
+    runner = await serve_webhook_app(app,
+                                     host=os.getenv('WEBHOOK_HOST', '0.0.0.0'),
+                                     port=int(os.getenv('WEBHOOK_PORT', 8080)))
+    # Stop gracefully on SIGTERM too, so the workers get terminated and the sessions closed.
+    stop_event = asyncio.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(signal_number, stop_event.set)
+    try:
+        if worker_index != 0:
+            async with stored_prices_refresh():
+                await stop_event.wait()
+            return
+
+        # Only the first worker registers the webhook and runs the scheduled jobs.
+        webhook_base_url = os.getenv('WEBHOOK_BASE_URL')
+        if webhook_base_url:
+            await bot.set_webhook(webhook_base_url.rstrip('/') + webhook_path, secret_token=webhook_secret)
+        else:
+            print('WEBHOOK_BASE_URL is not set, the webhook is not registered with Telegram.')
+        async with background_jobs():
+            await stop_event.wait()
+    finally:
+        await runner.cleanup()
+
+
+def run_webhook_worker(worker_index: int):
+    asyncio.run(main(worker_index=worker_index))
+
+
+def start_webhook_workers(workers: int) -> list:
+    # Spawned, not forked, so the workers don't inherit this process' event loop and connections.
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=run_webhook_worker, args=(worker_index,), daemon=True)
+                 for worker_index in range(1, workers)]
+    for process in processes:
+        process.start()
+    return processes
 
 
 async def start_cli():
@@ -42,22 +187,46 @@ async def start_cli():
     await cli.start()
 
 
-async def main():
+async def main(worker_index: int = 0):
     DATABASE_URL = os.getenv('DATABASE_URL')
     API_KEY = os.getenv('API_KEY')
 
     DB_ENGINE = await init_db(database_url=DATABASE_URL)
     async_session = async_sessionmaker(DB_ENGINE, expire_on_commit=False)
     database_manager_instance = AsyncDatabaseManager(async_session=async_session)
-    api_manager_instance = AsyncAPIManager(api_key=API_KEY)
+    api_manager_instance = AsyncAPIManager(api_key=API_KEY,
+                                           base_url=os.getenv('API_BASE_URL'),
+                                           chunk_size=int(os.getenv('API_CHUNK_SIZE', 50)),
+                                           max_concurrency=int(os.getenv('API_MAX_CONCURRENCY', 4)))
+    await api_manager_instance.start()
+    # Bot processes sharing the database split the users between them, see NodeCoordinator.
+    node_coordinator_instance = NodeCoordinator(node_count=int(os.getenv('NODE_COUNT', 1)),
+                                                node_index=int(os.getenv('NODE_INDEX', 0)))
+    # Renders the price charts in CHART_WORKERS processes, started on the first chart.
+    chart_service_instance = ChartService(workers=int(os.getenv('CHART_WORKERS', 2)))
 
     command = sys.argv[1].strip().lower() if len(sys.argv) > 1 else None
-    if command == 'bot':
-        await start_bot()
-    elif command == 'cli':
-        await start_cli()
-    else:
-        print('Enter a valid command ["bot", "cli"].')
+    webhook_workers = []
+    metrics_runner = await start_metrics(worker_index) if command in ('bot', 'webhook') else None
+    try:
+        if command == 'bot':
+            await start_bot()
+        elif command == 'cli':
+            await start_cli()
+        elif command == 'webhook':
+            if worker_index == 0:
+                webhook_workers = start_webhook_workers(int(os.getenv('WEBHOOK_WORKERS', 1)))
+            await start_webhook(worker_index=worker_index)
+        else:
+            print('Enter a valid command ["bot", "webhook", "cli"].')
+    finally:
+        for process in webhook_workers:
+            process.terminate()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        chart_service_instance.close()
+        await api_manager_instance.close()
+        await DB_ENGINE.dispose()
     
 
 if __name__ == "__main__":
@@ -0,0 +1,18 @@
+import asyncio
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from crypto_track.coordination import NodeCoordinator
+from crypto_track.database.manager import AsyncDatabaseManager
+from crypto_track.database.run import init_db
+
+
+@pytest.fixture
+def database(tmp_path):
+    # A migrated SQLite database behind fresh AsyncDatabaseManager and NodeCoordinator singletons.
+    engine = asyncio.run(init_db(f'sqlite+aiosqlite:///{tmp_path / "crypto_track.db"}', echo=False))
+    AsyncDatabaseManager._instance = NodeCoordinator._instance = None
+    AsyncDatabaseManager(async_sessionmaker(engine, expire_on_commit=False))
+    NodeCoordinator()
+    yield engine
+    asyncio.run(engine.dispose())
+    AsyncDatabaseManager._instance = NodeCoordinator._instance = None
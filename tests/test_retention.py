@@ -0,0 +1,47 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import insert, select, update
+from crypto_track.database.models import BackfillCursor, Crypto, Price
+from crypto_track.retention import RetentionPolicy, compact_prices, retention_limits
+
+NOW = datetime(2026, 10, 18, 12, 30, tzinfo=timezone.utc)
+POLICY = RetentionPolicy(raw_days=7, hourly_days=90)
+
+
+def test_finished_backfill_does_not_limit_retention():
+    finished_at = NOW - timedelta(days=20)
+    cursor = BackfillCursor(name='candles', position=finished_at, end_at=finished_at)
+    raw_before, hourly_before = retention_limits(POLICY, cursor, NOW)
+    assert raw_before == datetime(2026, 10, 11, 12, tzinfo=timezone.utc)
+    assert hourly_before == datetime(2026, 7, 20, tzinfo=timezone.utc)
+
+
+def test_finished_backfill_with_naive_dates():
+    # SQLite gives back naive UTC dates.
+    finished_at = (NOW - timedelta(days=20)).replace(tzinfo=None)
+    cursor = BackfillCursor(name='candles', position=finished_at, end_at=finished_at)
+    assert retention_limits(POLICY, cursor, NOW)[0] == datetime(2026, 10, 11, 12, tzinfo=timezone.utc)
+
+
+def test_pending_backfill_keeps_unfolded_history():
+    cursor = BackfillCursor(name='candles', position=NOW - timedelta(days=200, minutes=20), end_at=NOW - timedelta(days=1))
+    raw_before, hourly_before = retention_limits(POLICY, cursor, NOW)
+    assert raw_before == hourly_before == datetime(2026, 4, 1, 12, tzinfo=timezone.utc)
+
+
+def test_compact_prices_after_finished_backfill(database):
+    now = datetime.now(timezone.utc)
+
+    async def run():
+        async with database.begin() as conn:
+            await conn.execute(update(BackfillCursor).values(position=now - timedelta(days=20),
+                                                             end_at=now - timedelta(days=20)))
+            await conn.execute(insert(Crypto), [{'id': 1, 'name': 'Bitcoin', 'symbol': 'BTC'}])
+            await conn.execute(insert(Price), [{'crypto_id': 1, 'price': 100, 'date': now - timedelta(days=days)}
+                                               for days in (10, 9, 8, 1)])
+        await compact_prices(POLICY)
+        async with database.connect() as conn:
+            return (await conn.execute(select(Price.date))).scalars().all()
+
+    dates = asyncio.run(run())
+    assert len(dates) == 1